@@ -12,9 +12,13 @@ from aiogram.enums import ParseMode
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from utils.start_utils import start_schedulers
+from utils.cache import log_caches_stats
+from utils.http_clients import start_clients, close_clients
+from utils.image_executor import image_executor
+from utils.ai_funcs import aspect_preflight
 from database.build import PostgresBuild
-from database.model import Base
 from database.action_data_class import configurate_tables, DataInteraction
+from database.buffers import ActivityBuffer, CounterBuffer
 from config_data.config import load_config, Config
 from handlers.user_handlers import user_router
 from dialogs import get_dialogs
@@ -44,17 +48,33 @@ config: Config = load_config()
 
 
 async def main():
-    database = PostgresBuild(config.db.dns)
+    database = PostgresBuild(
+        config.db.dns,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        pool_timeout=config.db.pool_timeout,
+        pool_recycle=config.db.pool_recycle,
+        pool_pre_ping=config.db.pool_pre_ping,
+        statement_cache_size=config.db.statement_cache_size
+    )
     #await database.drop_tables(Base)
-    await database.create_tables(Base)
+    await database.migrate()
     session = database.session()
     await configurate_tables(session)
     db = DataInteraction(session)
+    activity = ActivityBuffer(db)
+    counters = CounterBuffer(db)
+
+    await start_clients()
 
     scheduler: AsyncIOScheduler = AsyncIOScheduler()
     scheduler.start()
 
-    await start_schedulers(scheduler, db)
+    await start_schedulers(scheduler, db, activity, counters)
+    scheduler.add_job(database.log_pool_stats, 'interval', minutes=1, id='log_pool_stats')
+    scheduler.add_job(log_caches_stats, 'interval', minutes=1, id='log_caches_stats')
+    scheduler.add_job(image_executor.log_stats, 'interval', minutes=1, id='log_image_executor_stats')
+    scheduler.add_job(aspect_preflight.log_stats, 'interval', minutes=10, id='log_aspect_preflight_stats')
 
     bot = Bot(token=config.bot.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     dp = Dispatcher()
@@ -63,7 +83,7 @@ async def main():
     dp.include_routers(user_router, *get_dialogs())
 
     # подключаем middleware
-    dp.update.middleware(TransferObjectsMiddleware())
+    dp.update.middleware(TransferObjectsMiddleware(shared_session=config.db.shared_session))
     dp.update.middleware(RemindMiddleware())
 
     # запуск
@@ -72,10 +92,14 @@ async def main():
     logger.info('Bot start polling')
 
     try:
-        await dp.start_polling(bot, _session=session, _scheduler=scheduler)
+        await dp.start_polling(bot, _session=session, _scheduler=scheduler, _activity=activity, _counters=counters)
     except Exception as e:
         logger.exception(e)
     finally:
+        await counters.close()
+        await activity.close()
+        await close_clients()
+        await image_executor.shutdown()
         logger.info('Bot stop polling')
 
 
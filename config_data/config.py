@@ -16,6 +16,13 @@ class tg_bot:
 @dataclass
 class DB:
     dns: str
+    shared_session: bool
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int
+    pool_pre_ping: bool
+    statement_cache_size: int
 
 
 @dataclass
@@ -39,6 +46,25 @@ class Unifically:
     api_token: str
 
 
+@dataclass
+class Http:
+    limit_per_host: int
+    dns_ttl: int
+    keepalive_timeout: float
+    connect_timeout: float
+    read_timeout: float
+    total_timeout: float
+
+
+@dataclass
+class Images:
+    memory_budget: int
+    executor: str
+    workers: int
+    queue_size: int
+    upload_cache_ttl: int
+
+
 @dataclass
 class Config:
     bot: tg_bot
@@ -47,6 +73,8 @@ class Config:
     yookassa: Yookassa
     oxapay: OxaPay
     unifically: Unifically
+    http: Http
+    images: Images
 
 
 def load_config(path: str | None = None) -> Config:
@@ -59,7 +87,14 @@ def load_config(path: str | None = None) -> Config:
             admin_ids=list(map(int, env.list('admins')))
             ),
         db=DB(
-            dns=env('dns')
+            dns=env('dns'),
+            shared_session=env.bool('db_shared_session', False),
+            pool_size=env.int('db_pool_size', 5),
+            max_overflow=env.int('db_max_overflow', 10),
+            pool_timeout=env.float('db_pool_timeout', 30),
+            pool_recycle=env.int('db_pool_recycle', -1),
+            pool_pre_ping=env.bool('db_pool_pre_ping', False),
+            statement_cache_size=env.int('db_statement_cache_size', 100)
         ),
         nats=NatsConfig(
             servers=env.list('nats')
@@ -74,4 +109,19 @@ def load_config(path: str | None = None) -> Config:
         unifically=Unifically(
             api_token=env('unifically_api_token')
         ),
+        http=Http(
+            limit_per_host=env.int('http_limit_per_host', 20),
+            dns_ttl=env.int('http_dns_ttl', 300),
+            keepalive_timeout=env.float('http_keepalive_timeout', 60),
+            connect_timeout=env.float('http_connect_timeout', 10),
+            read_timeout=env.float('http_read_timeout', 60),
+            total_timeout=env.float('http_total_timeout', 180)
+        ),
+        images=Images(
+            memory_budget=env.int('image_memory_budget_mb', 256) * 1024 * 1024,
+            executor=env('image_executor', 'thread'),
+            workers=env.int('image_workers', 2),
+            queue_size=env.int('image_queue_size', 16),
+            upload_cache_ttl=env.int('image_upload_cache_ttl', 3600)
+        ),
     )
@@ -1,9 +1,31 @@
 import datetime
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable
 
-from sqlalchemy import select, insert, update, column, text, delete
+from sqlalchemy import (select, insert, update, column, text, delete, values, func, cast, union_all, BigInteger, DateTime,
+                        Date, String, Row, Select, literal)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from database.model import (UsersTable, DeeplinksTable, OneTimeLinksIdsTable, AdminsTable, StaticTable, RatesTable)
+from database.model import (UsersTable, DeeplinksTable, OneTimeLinksIdsTable, AdminsTable, StaticTable, RatesTable,
+                            PaymentsTable, GenerationsTable, DailyRollupsTable, DailyTotalsTable, WatermarksTable)
+from utils.cache import AsyncCache
+
+if TYPE_CHECKING:
+    from database.buffers import CounterBuffer
+
+
+'''
+    Общие для всех экземпляров DataInteraction кэши чтения. Методы записи сбрасывают затронутые ключи,
+    TTL ограничивает устаревание на случай изменений в обход этих методов.
+    Строки в кэшах отсоединены от сессий и только читаются
+'''
+_users_cache = AsyncCache('users', max_size=10_000, ttl=30)
+# Диплинки по ссылке нужны /start только для проверки существования, счетчики в них могут отставать
+_deeplinks_cache = AsyncCache('deeplinks', max_size=1_000, ttl=300)
+_deeplinks_count_cache = AsyncCache('deeplinks_count', max_size=1, ttl=300)
+_admins_cache = AsyncCache('admins', max_size=1, ttl=None)
+_rates_cache = AsyncCache('rates', max_size=1, ttl=None)
 
 
 async def configurate_tables(sessions: async_sessionmaker):
@@ -13,34 +35,213 @@ async def configurate_tables(sessions: async_sessionmaker):
         await session.commit()
 
 
+class _SessionScope:
+    """
+    Подменяет фабрику сессий так, что все методы DataInteraction работают в одной сессии.
+    При autocommit=False commit внутри методов только сбрасывает изменения, транзакцию фиксирует владелец сессии
+    """
+    def __init__(self, session: AsyncSession, root: async_sessionmaker, autocommit: bool = False):
+        self.session = session
+        self.root = root
+        self.autocommit = autocommit
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    async def commit(self):
+        if self.autocommit:
+            await self.session.commit()
+        else:
+            await self.session.flush()
+
+    def __getattr__(self, item):
+        return getattr(self.session, item)
+
+
+def _users_static_columns() -> tuple:
+    """Счетчики пользователей для статистики: всего, активные и провзаимодействовавшие за сутки"""
+    now = datetime.datetime.today()
+    return (
+        func.count().label('total'),
+        func.count().filter(UsersTable.active == 1).label('active'),
+        func.count().filter(UsersTable.activity > now - datetime.timedelta(days=1)).label('activity'),
+    )
+
+
+def _users_projection(columns: tuple[str, ...], active_only: bool = False) -> Select:
+    """select только нужных колонок users, по умолчанию user_id"""
+    query = select(*[UsersTable.__table__.c[column] for column in columns or ('user_id',)])
+    if active_only:
+        query = query.where(UsersTable.active == 1)
+    return query
+
+
+def _period_sums(day, amount) -> tuple:
+    """Суммы за сегодня, текущую неделю, текущий месяц и за все время"""
+    today = datetime.date.today()
+    week = today - datetime.timedelta(days=today.weekday())
+    month = today.replace(day=1)
+    return (
+        cast(func.coalesce(func.sum(amount).filter(day == today), 0), BigInteger).label('today'),
+        cast(func.coalesce(func.sum(amount).filter(day >= week), 0), BigInteger).label('week'),
+        cast(func.coalesce(func.sum(amount).filter(day >= month), 0), BigInteger).label('month'),
+        cast(func.coalesce(func.sum(amount), 0), BigInteger).label('total'),
+    )
+
+
+def _grouped_by_day(deeplink, created, *counters) -> Select:
+    """select (deeplink, day, *counters), сгруппированный по диплинку и дню"""
+    deeplink = func.coalesce(deeplink, '')
+    day = cast(created, Date)
+    return select(deeplink, day, *counters).group_by(deeplink, day)
+
+
+async def _roll_up(session: AsyncSession, name: str, table, created, lag: datetime.timedelta,
+                   columns: list[str], build_rows: Callable[[int, int], Select]):
+    """
+    Сворачивает строки table с id после водяного знака name в дневные агрегаты по диплинкам и в суммы за день.
+    build_rows(last_id, max_id) возвращает select из (deeplink, day, *columns).
+    Водяной знак с задержкой lag - эвристика, а не гарантия: id выдаются до commit, и строка транзакции,
+    которая зафиксировалась позже чем через lag после вставки, окажется ниже водяного знака и в агрегаты не попадет
+    """
+    await session.execute(pg_insert(WatermarksTable).values(name=name, last_id=0).on_conflict_do_nothing())
+    last_id = await session.scalar(
+        select(WatermarksTable.last_id).where(WatermarksTable.name == name).with_for_update()
+    )
+    max_id = await session.scalar(select(func.max(table.id)).where(
+        table.id > last_id,
+        created < func.clock_timestamp() - lag
+    ))
+    if max_id is None:
+        return
+    query = pg_insert(DailyRollupsTable).from_select(['deeplink', 'day', *columns], build_rows(last_id, max_id))
+    await session.execute(query.on_conflict_do_update(
+        index_elements=[DailyRollupsTable.deeplink, DailyRollupsTable.day],
+        set_={column: getattr(DailyRollupsTable, column) + query.excluded[column] for column in columns}
+    ))
+    rows = build_rows(last_id, max_id).subquery()
+    _, day, *counters = rows.c
+    query = pg_insert(DailyTotalsTable).from_select(
+        ['day', *columns], select(day, *[func.sum(counter) for counter in counters]).group_by(day)
+    )
+    await session.execute(query.on_conflict_do_update(
+        index_elements=[DailyTotalsTable.day],
+        set_={column: getattr(DailyTotalsTable, column) + query.excluded[column] for column in columns}
+    ))
+    await session.execute(update(WatermarksTable).where(WatermarksTable.name == name).values(last_id=max_id))
+
+
 class DataInteraction():
-    def __init__(self, session: async_sessionmaker):
+    def __init__(self, session: async_sessionmaker, users: dict[int, UsersTable] | None = None,
+                 counters: 'CounterBuffer | None' = None):
         self._sessions = session
+        # Кэш пользователей на время апдейта, включается только вместе с общей сессией
+        self._users = users
+        # Буфер счетчиков: без него add_entry и add_refs пишут в базу сразу
+        self._counters = counters
+        # Пользователи, измененные внутри transaction(): их записи в общем кэше сбрасываются еще раз после commit
+        self._touched: set[int] | None = None
+
+    @classmethod
+    @asynccontextmanager
+    async def request_scope(cls, sessions: async_sessionmaker,
+                            counters: 'CounterBuffer | None' = None) -> AsyncIterator['DataInteraction']:
+        """Одна сессия и кэш пользователей на все вызовы в рамках обработки одного апдейта"""
+        async with sessions() as session:
+            yield cls(_SessionScope(session, sessions, autocommit=True), users={}, counters=counters)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator['DataInteraction']:
+        """Выполняет все вызовы внутри блока на одном соединении и фиксирует их одним commit"""
+        scope = self._sessions
+        if isinstance(scope, _SessionScope):
+            if not scope.autocommit:
+                yield self
+                return
+            inner = DataInteraction(_SessionScope(scope.session, scope.root), users=self._users,
+                                    counters=self._counters)
+            inner._touched = set()
+            try:
+                yield inner
+            except BaseException:
+                await scope.session.rollback()
+                raise
+            await scope.session.commit()
+            _users_cache.invalidate(*inner._touched)
+            return
+        async with scope() as session:
+            inner = DataInteraction(_SessionScope(session, scope), counters=self._counters)
+            inner._touched = set()
+            async with session.begin():
+                yield inner
+        _users_cache.invalidate(*inner._touched)
+
+    def detached(self) -> 'DataInteraction':
+        """Экземпляр со своими сессиями для фоновых задач, которые переживают апдейт"""
+        if isinstance(self._sessions, _SessionScope):
+            return DataInteraction(self._sessions.root, counters=self._counters)
+        return self
+
+    def _root_sessions(self) -> async_sessionmaker:
+        return self._sessions.root if isinstance(self._sessions, _SessionScope) else self._sessions
+
+    def _in_transaction(self) -> bool:
+        return isinstance(self._sessions, _SessionScope) and not self._sessions.autocommit
+
+    def _shared_sessions(self) -> async_sessionmaker | _SessionScope:
+        """
+        Сессии для загрузки в общие кэши: сессия апдейта, чтобы не брать из пула второе соединение.
+        Внутри transaction() - отдельная сессия, иначе в кэш попадут незафиксированные изменения
+        """
+        return self._root_sessions() if self._in_transaction() else self._sessions
+
+    def _forget_users(self, *user_ids: int, shared: bool = True):
+        if shared:
+            _users_cache.invalidate(*user_ids)
+            if self._touched is not None:
+                self._touched.update(user_ids)
+        if self._users is None:
+            return
+        for user_id in user_ids:
+            self._users.pop(user_id, None)
 
     async def check_user(self, user_id: int) -> bool:
-        async with self._sessions() as session:
-            result = await session.scalar(select(UsersTable).where(UsersTable.user_id == user_id))
-        return True if result else False
+        return await self.get_user(user_id) is not None
 
-    async def add_user(self, user_id: int, username: str, name: str, referral: int | None = None, link: str | None = None):
-        if await self.check_user(user_id):
-            return
+    async def add_user(self, user_id: int, username: str, name: str, referral: int | None = None, link: str | None = None) -> bool:
+        """Добавляет пользователя, если его еще нет. Возвращает True, если пользователь новый"""
         async with self._sessions() as session:
-            await session.execute(insert(UsersTable).values(
+            result = await session.scalar(pg_insert(UsersTable).values(
                 user_id=user_id,
                 username=username,
                 name=name,
                 referral=referral,
                 join=link
-            ))
+            ).on_conflict_do_nothing(index_elements=[UsersTable.user_id]).returning(UsersTable.id))
             await session.commit()
+        self._forget_users(user_id)
+        return result is not None
+
+    def pending(self, counter: str, key) -> int:
+        """Приращение счетчика ('entry' по ссылке диплинка, 'refs' по user_id), еще не записанное в базу"""
+        return self._counters.pending(counter, key) if self._counters is not None else 0
 
     async def add_refs(self, user_id: int):
+        if self._counters is not None:
+            self._counters.add('refs', user_id)
+            return
         async with self._sessions() as session:
             await session.execute(update(UsersTable).where(UsersTable.user_id == user_id).values(
                 refs=UsersTable.refs + 1
             ))
             await session.commit()
+        self._forget_users(user_id)
 
     async def add_deeplink(self, link: str, name: str):
         async with self._sessions() as session:
@@ -49,14 +250,53 @@ class DataInteraction():
                 name=name
             ))
             await session.commit()
+        _deeplinks_cache.invalidate(link)
+        _deeplinks_count_cache.clear()
 
     async def add_entry(self, link: str):
+        if self._counters is not None:
+            self._counters.add('entry', link)
+            return
         async with self._sessions() as session:
             await session.execute(update(DeeplinksTable).where(DeeplinksTable.link == link).values(
                 entry=DeeplinksTable.entry+1
             ))
             await session.commit()
 
+    async def add_counters(self, entries: dict[str, int], refs: dict[int, int],
+                           on_commit: Callable[[], None] | None = None):
+        """
+        Прибавляет накопленные переходы по диплинкам и рефералов одним UPDATE ... FROM (VALUES ...) на таблицу.
+        on_commit вызывается сразу после commit, до закрытия сессии
+        """
+        async with self._sessions() as session:
+            if entries:
+                data = values(
+                    column('link', String),
+                    column('count', BigInteger),
+                    name='data'
+                ).data(list(entries.items()))
+                await session.execute(
+                    update(DeeplinksTable).where(DeeplinksTable.link == data.c.link).values(
+                        entry=DeeplinksTable.entry + data.c.count
+                    ).execution_options(synchronize_session=False)
+                )
+            if refs:
+                data = values(
+                    column('user_id', BigInteger),
+                    column('count', BigInteger),
+                    name='data'
+                ).data(list(refs.items()))
+                await session.execute(
+                    update(UsersTable).where(UsersTable.user_id == data.c.user_id).values(
+                        refs=UsersTable.refs + data.c.count
+                    ).execution_options(synchronize_session=False)
+                )
+            await session.commit()
+            self._forget_users(*refs)
+            if on_commit is not None:
+                on_commit()
+
     async def add_link(self, link: str):
         async with self._sessions() as session:
             await session.execute(insert(OneTimeLinksIdsTable).values(
@@ -71,6 +311,7 @@ class DataInteraction():
                 name=name
             ))
             await session.commit()
+        _admins_cache.clear()
 
     async def add_rate(self, amount: int, cost: int, text: str | None, rate: str):
         async with self._sessions() as session:
@@ -81,30 +322,179 @@ class DataInteraction():
                 rate=rate
             ))
             await session.commit()
+        _rates_cache.clear()
 
-    async def add_income(self, income: int):
+    async def add_payment(self, user_id: int, amount: int, rate: str, count: int, provider: str,
+                          deeplink: str | None = None):
+        """Записывает платеж в журнал. Журнал только дополняется, поэтому запись не блокирует общих строк"""
         async with self._sessions() as session:
-            await session.execute(update(StaticTable).values(
-                total=StaticTable.total + income,
-                today=StaticTable.today + income,
-                week=StaticTable.week + income,
-                month=StaticTable.month + income
+            await session.execute(insert(PaymentsTable).values(
+                user_id=user_id,
+                amount=amount,
+                rate=rate,
+                count=count,
+                provider=provider,
+                deeplink=deeplink
             ))
             await session.commit()
 
-    async def get_static(self):
+    async def update_rollups(self, lag: datetime.timedelta = datetime.timedelta(minutes=1)):
+        """
+        Добавляет в дневные агрегаты новых пользователей, платежи и генерации, появившиеся после прошлого запуска,
+        и пересчитывает активных пользователей за сегодня. События берутся только старше lag, чтобы не пропустить
+        еще не зафиксированные транзакции. Это эвристика: транзакция дольше lag может потерять свои строки, см. _roll_up
+        """
         async with self._sessions() as session:
-            result = await session.scalar(select(StaticTable))
-        return result
+            await _roll_up(
+                session, 'users', UsersTable, UsersTable.entry, lag, ['new_users'],
+                lambda last_id, max_id: _grouped_by_day(
+                    UsersTable.join, UsersTable.entry, func.count()
+                ).where(UsersTable.id > last_id, UsersTable.id <= max_id)
+            )
+            await _roll_up(
+                session, 'payments', PaymentsTable, PaymentsTable.create, lag, ['purchases', 'revenue'],
+                lambda last_id, max_id: _grouped_by_day(
+                    PaymentsTable.deeplink, PaymentsTable.create, func.count(), func.sum(PaymentsTable.amount)
+                ).where(PaymentsTable.id > last_id, PaymentsTable.id <= max_id)
+            )
+            await _roll_up(
+                session, 'generations', GenerationsTable, GenerationsTable.create, lag, ['generations'],
+                lambda last_id, max_id: _grouped_by_day(
+                    UsersTable.join, GenerationsTable.create, func.count()
+                ).join(UsersTable, UsersTable.user_id == GenerationsTable.user_id).where(
+                    GenerationsTable.id > last_id, GenerationsTable.id <= max_id
+                )
+            )
+
+            # users.activity хранит только последний визит, поэтому активных за день можно посчитать
+            # лишь для текущего дня: значение перезаписывается при каждом запуске и замирает после полуночи
+            today = datetime.date.today()
+            active = UsersTable.activity >= datetime.datetime.combine(today, datetime.time())
+            deeplink = func.coalesce(UsersTable.join, '')
+            query = pg_insert(DailyRollupsTable).from_select(
+                ['deeplink', 'day', 'active_users'],
+                select(deeplink, literal(today, Date), func.count()).where(active).group_by(deeplink)
+            )
+            await session.execute(query.on_conflict_do_update(
+                index_elements=[DailyRollupsTable.deeplink, DailyRollupsTable.day],
+                set_={'active_users': query.excluded.active_users}
+            ))
+            query = pg_insert(DailyTotalsTable).from_select(
+                ['day', 'active_users'], select(literal(today, Date), func.count()).where(active)
+            )
+            await session.execute(query.on_conflict_do_update(
+                index_elements=[DailyTotalsTable.day],
+                set_={'active_users': query.excluded.active_users}
+            ))
+            await session.commit()
+
+    async def get_rollups(self, deeplink: str | None = None, days: int = 3) -> dict[datetime.date, Row]:
+        """Дневные агрегаты за последние days дней, по одному диплинку или суммарно по всем"""
+        since = datetime.date.today() - datetime.timedelta(days=days - 1)
+        # По диплинку читается его строка за день по первичному ключу, суммарно - готовая сумма из daily_totals
+        table = DailyRollupsTable if deeplink else DailyTotalsTable
+        query = select(
+            table.day, table.new_users, table.active_users, table.purchases, table.revenue, table.generations
+        ).where(table.day >= since)
+        if deeplink:
+            query = query.where(DailyRollupsTable.deeplink == deeplink)
+        async with self._sessions() as session:
+            result = await session.execute(query)
+        return {row.day: row for row in result.all()}
+
+    async def get_income(self, deeplink: str | None = None) -> Row:
+        """Доход за сегодня, неделю, месяц и все время: дневные агрегаты плюс еще не свернутый хвост журнала"""
+        last_id = select(WatermarksTable.last_id).where(WatermarksTable.name == 'payments').scalar_subquery()
+        table = DailyRollupsTable if deeplink else DailyTotalsTable
+        rollups = select(table.day.label('day'), table.revenue.label('amount'))
+        tail = select(cast(PaymentsTable.create, Date).label('day'), PaymentsTable.amount.label('amount')).where(
+            PaymentsTable.id > func.coalesce(last_id, 0)
+        )
+        if deeplink:
+            rollups = rollups.where(DailyRollupsTable.deeplink == deeplink)
+            tail = tail.where(PaymentsTable.deeplink == deeplink)
+        income = union_all(rollups, tail).subquery()
+        async with self._sessions() as session:
+            result = await session.execute(select(*_period_sums(income.c.day, income.c.amount)))
+        return result.one()
+
+    async def add_generation(self, user_id: int, kind: str):
+        """Списывает одну генерацию с баланса, увеличивает счетчик и пишет событие для статистики одной транзакцией"""
+        async with self._sessions() as session:
+            await session.execute(update(UsersTable).where(UsersTable.user_id == user_id).values({
+                getattr(UsersTable, f'{kind}s'): getattr(UsersTable, f'{kind}s') - 1,
+                getattr(UsersTable, f'{kind}s_count'): getattr(UsersTable, f'{kind}s_count') + 1
+            }))
+            await session.execute(insert(GenerationsTable).values(
+                user_id=user_id,
+                kind=kind
+            ))
+            await session.commit()
+        self._forget_users(user_id)
+
+    async def get_users_static(self, join: str | None = None) -> Row:
+        query = select(*_users_static_columns())
+        if join:
+            query = query.where(UsersTable.join == join)
+        async with self._sessions() as session:
+            result = await session.execute(query)
+        return result.one()
 
     async def get_users(self):
         async with self._sessions() as session:
             result = await session.scalars(select(UsersTable))
         return result.fetchall()
 
-    async def get_user(self, user_id: int):
-        async with self._sessions() as session:
-            result = await session.scalar(select(UsersTable).where(UsersTable.user_id == user_id))
+    async def iter_users(self, *columns: str, active_only: bool = False, chunk_size: int = 1000) -> AsyncIterator[Row]:
+        """
+        Отдает пользователей пачками по chunk_size в порядке id, не загружая всю таблицу в память.
+        Выбираются только переданные колонки (по умолчанию user_id) и id, строки читаются на уровне Core.
+        Каждая пачка читается по индексу первичного ключа после последнего id в своей короткой сессии,
+        поэтому соединение и транзакция не удерживаются, пока вызывающий обрабатывает строки
+        """
+        columns = columns or ('user_id',)
+        query = _users_projection(columns if 'id' in columns else (*columns, 'id'), active_only)
+        query = query.order_by(UsersTable.id).limit(chunk_size)
+        last_id = None
+        while True:
+            async with self._root_sessions()() as session:
+                connection = await session.connection()
+                result = await connection.execute(
+                    query if last_id is None else query.where(UsersTable.id > last_id)
+                )
+                rows = result.all()
+            for row in rows:
+                yield row
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1].id
+
+    async def _load_user(self, user_id: int) -> UsersTable | None:
+        query = select(UsersTable).where(UsersTable.user_id == user_id).execution_options(populate_existing=True)
+        async with self._shared_sessions()() as session:
+            user = await session.scalar(query)
+            # Строка попадает в общий кэш и не должна зависеть от rollback сессии, в которой загружена
+            if user is not None:
+                session.expunge(user)
+        return user
+
+    async def get_user(self, user_id: int, for_update: bool = False):
+        """
+        Пользователь из кэша апдейта, общего кэша или базы.
+        Внутри transaction() и при for_update строка всегда читается из базы в текущей транзакции
+        """
+        if self._users is not None and not for_update and user_id in self._users:
+            return self._users[user_id]
+        if for_update or self._in_transaction():
+            query = select(UsersTable).where(UsersTable.user_id == user_id).execution_options(populate_existing=True)
+            if for_update:
+                query = query.with_for_update()
+            async with self._sessions() as session:
+                result = await session.scalar(query)
+        else:
+            result = await _users_cache.get(user_id, lambda: self._load_user(user_id))
+        if self._users is not None and result is not None:
+            self._users[user_id] = result
         return result
 
     async def get_user_by_username(self, username: str):
@@ -117,46 +507,99 @@ class DataInteraction():
             result = await session.scalars(select(OneTimeLinksIdsTable))
         return result.fetchall()
 
+    async def get_link(self, link: str):
+        async with self._sessions() as session:
+            result = await session.scalar(select(OneTimeLinksIdsTable).where(OneTimeLinksIdsTable.link == link))
+        return result
+
     async def get_admins(self):
         async with self._sessions() as session:
             result = await session.scalars(select(AdminsTable))
         return result.fetchall()
 
-    async def get_rates(self):
-        async with self._sessions() as session:
-            result = await session.scalars(select(RatesTable))
-        return result.fetchall()
+    async def _load_admin_ids(self) -> frozenset[int]:
+        async with self._shared_sessions()() as session:
+            result = await session.scalars(select(AdminsTable.user_id))
+        return frozenset(result.fetchall())
+
+    async def get_admin_ids(self) -> frozenset[int]:
+        """id админов из базы, загружаются один раз и перечитываются после add_admin и del_admin"""
+        return await _admins_cache.get('ids', self._load_admin_ids)
+
+    async def _load_rates_catalogue(self) -> tuple[dict[int, RatesTable], dict[str, list[RatesTable]]]:
+        query = select(RatesTable).order_by(RatesTable.id).execution_options(populate_existing=True)
+        async with self._shared_sessions()() as session:
+            result = await session.scalars(query)
+            by_id = {rate.id: rate for rate in result.fetchall()}
+            for rate in by_id.values():
+                session.expunge(rate)
+        by_type: dict[str, list[RatesTable]] = {}
+        for rate in by_id.values():
+            by_type.setdefault(rate.rate, []).append(rate)
+        return by_id, by_type
+
+    async def _get_rates_catalogue(self) -> tuple[dict[int, RatesTable], dict[str, list[RatesTable]]]:
+        """Каталог тарифов (по id, по типу), перечитывается после add_rate и del_rate"""
+        return await _rates_cache.get('catalogue', self._load_rates_catalogue)
+
+    async def get_rates(self) -> list[RatesTable]:
+        by_id, _ = await self._get_rates_catalogue()
+        return list(by_id.values())
+
+    async def get_rates_by_type(self, rate_type: str) -> list[RatesTable]:
+        _, by_type = await self._get_rates_catalogue()
+        return by_type.get(rate_type, [])
 
     async def get_rate(self, id: int):
-        async with self._sessions() as session:
-            result = await session.scalar(select(RatesTable).where(RatesTable.id == id))
-        return result
+        by_id, _ = await self._get_rates_catalogue()
+        return by_id.get(id)
 
     async def get_deeplinks(self):
         async with self._sessions() as session:
             result = await session.scalars(select(DeeplinksTable))
         return result.fetchall()
 
+    async def get_deeplinks_page(self, after: int | None = None, before: int | None = None,
+                                 limit: int = 10) -> list[Row]:
+        """
+        Страница диплинков (id, name, link, entry) в порядке id: следующие limit после after
+        или предыдущие limit перед before. Выбирается по индексу первичного ключа без OFFSET
+        """
+        query = select(DeeplinksTable.id, DeeplinksTable.name, DeeplinksTable.link, DeeplinksTable.entry).limit(limit)
+        if before is not None:
+            query = query.where(DeeplinksTable.id < before).order_by(DeeplinksTable.id.desc())
+        else:
+            if after is not None:
+                query = query.where(DeeplinksTable.id > after)
+            query = query.order_by(DeeplinksTable.id)
+        async with self._sessions() as session:
+            result = await session.execute(query)
+        rows = result.all()
+        return rows[::-1] if before is not None else rows
+
+    async def _load_deeplinks_count(self) -> int:
+        async with self._shared_sessions()() as session:
+            return await session.scalar(select(func.count()).select_from(DeeplinksTable))
+
+    async def get_deeplinks_count(self) -> int:
+        """Число диплинков, перечитывается после add_deeplink и del_deeplink"""
+        return await _deeplinks_count_cache.get('count', self._load_deeplinks_count)
+
     async def get_deeplink(self, id: int):
         async with self._sessions() as session:
             result = await session.scalar(select(DeeplinksTable).where(DeeplinksTable.id == id))
         return result
 
-    async def update_deeplink_earn(self, link: str, earn: int):
-        async with self._sessions() as session:
-            await session.execute(update(DeeplinksTable).where(DeeplinksTable.link == link).values(
-                earned=DeeplinksTable.earned + earn,
-                today=DeeplinksTable.today + earn,
-                week=DeeplinksTable.week + earn
-            ))
-            await session.commit()
+    async def _load_deeplink_by_link(self, link: str) -> DeeplinksTable | None:
+        query = select(DeeplinksTable).where(DeeplinksTable.link == link).execution_options(populate_existing=True)
+        async with self._shared_sessions()() as session:
+            deeplink = await session.scalar(query)
+            if deeplink is not None:
+                session.expunge(deeplink)
+        return deeplink
 
-    async def set_deeplink_value(self, deeplink_id: int, **kwargs):
-        async with self._sessions() as session:
-            await session.execute(update(DeeplinksTable).where(DeeplinksTable.id == deeplink_id).values(
-                kwargs
-            ))
-            await session.commit()
+    async def get_deeplink_by_link(self, link: str):
+        return await _deeplinks_cache.get(link, lambda: self._load_deeplink_by_link(link))
 
     async def set_activity(self, user_id: int):
         async with self._sessions() as session:
@@ -164,6 +607,26 @@ class DataInteraction():
                 activity=datetime.datetime.today()
             ))
             await session.commit()
+        self._forget_users(user_id)
+
+    async def set_activities(self, activities: dict[int, datetime.datetime], chunk_size: int = 1000):
+        """Обновляет активность сразу нескольких пользователей одним UPDATE ... FROM (VALUES ...)"""
+        items = list(activities.items())
+        async with self._sessions() as session:
+            for i in range(0, len(items), chunk_size):
+                data = values(
+                    column('user_id', BigInteger),
+                    column('activity', DateTime),
+                    name='data'
+                ).data(items[i:i + chunk_size])
+                await session.execute(
+                    update(UsersTable).where(UsersTable.user_id == data.c.user_id).values(
+                        activity=data.c.activity
+                    ).execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        # Активность из кэшированных строк не читается, общий кэш сбрасывать незачем
+        self._forget_users(*activities, shared=False)
 
     async def set_active(self, user_id: int, active: int):
         async with self._sessions() as session:
@@ -171,27 +634,37 @@ class DataInteraction():
                 active=active
             ))
             await session.commit()
+        self._forget_users(user_id)
 
-    async def set_static_value(self, **kwargs):
+    async def increment_user_value(self, user_id: int, column: str, value: any):
         async with self._sessions() as session:
-            await session.execute(update(StaticTable).values(
-                kwargs
+            await session.execute(update(UsersTable).where(UsersTable.user_id == user_id).values(
+                {
+                    getattr(UsersTable, column): getattr(UsersTable, column) + value
+                }
             ))
             await session.commit()
+        self._forget_users(user_id)
 
-    async def increment_user_value(self, user_id: int, column: str, value: any):
+    async def increment_user_values(self, user_id: int | list[int], **columns: int):
+        """Прибавляет значения сразу к нескольким колонкам одного или нескольких пользователей одним UPDATE"""
+        user_ids = user_id if isinstance(user_id, list) else [user_id]
         async with self._sessions() as session:
-            await session.execute(update(UsersTable).where(UsersTable.user_id == user_id).values(
+            await session.execute(update(UsersTable).where(UsersTable.user_id.in_(user_ids)).values(
                 {
                     getattr(UsersTable, column): getattr(UsersTable, column) + value
+                    for column, value in columns.items()
                 }
             ))
             await session.commit()
+        self._forget_users(*user_ids)
 
     async def del_deeplink(self, id: int):
         async with self._sessions() as session:
             await session.execute(delete(DeeplinksTable).where(DeeplinksTable.id == id))
             await session.commit()
+        _deeplinks_cache.clear()
+        _deeplinks_count_cache.clear()
 
     async def del_link(self, link_id: str):
         async with self._sessions() as session:
@@ -202,8 +675,10 @@ class DataInteraction():
         async with self._sessions() as session:
             await session.execute(delete(AdminsTable).where(AdminsTable.user_id == user_id))
             await session.commit()
+        _admins_cache.clear()
 
     async def del_rate(self, id: int):
         async with self._sessions() as session:
             await session.execute(delete(RatesTable).where(RatesTable.id == id))
             await session.commit()
+        _rates_cache.clear()
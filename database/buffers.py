@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import logging
+from typing import Hashable
+
+from database.action_data_class import DataInteraction
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    """
+    Копит время последней активности пользователей в памяти и сбрасывает
+    его в базу одним UPDATE по таймеру или при достижении max_size записей
+    """
+    def __init__(self, session: DataInteraction, max_size: int = 500):
+        self._session = session
+        self._max_size = max_size
+        self._pending: dict[int, datetime.datetime] = {}
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, user_id: int):
+        self._pending[user_id] = datetime.datetime.today()
+        if len(self._pending) >= self._max_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await self._session.set_activities(pending)
+            except Exception as err:
+                logger.error(f'Не удалось сохранить активность {len(pending)} пользователей: {err}')
+                # Возвращаем записи обратно, не перетирая более свежие отметки
+                for user_id, activity in pending.items():
+                    self._pending.setdefault(user_id, activity)
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+
+class CounterBuffer:
+    """
+    Копит приращения счетчиков (переходы по диплинкам, приглашенные рефералы) в памяти и прибавляет
+    их в базе одним UPDATE на таблицу, чтобы /start не упирался в блокировки одних и тех же строк
+    """
+    def __init__(self, session: DataInteraction, max_size: int = 500):
+        self._session = session
+        self._max_size = max_size
+        self._pending: dict[str, dict[Hashable, int]] = {}
+        # Приращения, которые сейчас записываются в базу, до commit еще учитываются в pending()
+        self._flushing: dict[str, dict[Hashable, int]] = {}
+        self._lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(counts) for counts in self._pending.values())
+
+    def add(self, counter: str, key: Hashable, value: int = 1):
+        counts = self._pending.setdefault(counter, {})
+        counts[key] = counts.get(key, 0) + value
+        if len(self) >= self._max_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def pending(self, counter: str, key: Hashable) -> int:
+        """Еще не записанное в базу приращение счетчика"""
+        return self._pending.get(counter, {}).get(key, 0) + self._flushing.get(counter, {}).get(key, 0)
+
+    async def flush(self):
+        async with self._lock:
+            if not len(self):
+                return
+            flushing = self._flushing = self._pending
+            self._pending = {}
+            committed = False
+
+            def on_commit():
+                # Записанные приращения уже видны в базе: до следующего await перестаем учитывать их в pending()
+                nonlocal committed
+                committed = True
+                self._flushing = {}
+
+            try:
+                await self._session.add_counters(
+                    entries=flushing.get('entry', {}),
+                    refs=flushing.get('refs', {}),
+                    on_commit=on_commit
+                )
+            except Exception as err:
+                if committed:
+                    logger.error(f'Ошибка после сохранения {sum(map(len, flushing.values()))} счетчиков: {err}')
+                    return
+                logger.error(f'Не удалось сохранить {sum(map(len, flushing.values()))} счетчиков: {err}')
+                # Приращения суммируются с накопленными за время записи
+                for counter, counts in flushing.items():
+                    for key, value in counts.items():
+                        self.add(counter, key, value)
+            finally:
+                self._flushing = {}
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
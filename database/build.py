@@ -1,18 +1,47 @@
+import logging
+
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from database.model import Base
+from database.migrations import migrate
+from database.pool_metrics import PoolMetrics, InstrumentedQueuePool
+
+
+logger = logging.getLogger(__name__)
 
 
 class PostgresBuild:
-    def __init__(self, url: str):
-        self.engine = create_async_engine(url)
+    def __init__(self, url: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30,
+                 pool_recycle: int = -1, pool_pre_ping: bool = False, statement_cache_size: int = 100):
+        self.engine = create_async_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            connect_args={'prepared_statement_cache_size': statement_cache_size}
+        )
+        self.metrics = PoolMetrics()
+        self.metrics.attach(self.engine.pool)
+        self.engine.pool.metrics = self.metrics
 
     async def create_tables(self, base):
         async with self.engine.begin() as conn:
             await conn.run_sync(base.metadata.create_all)
 
+    async def migrate(self, target: int | None = None) -> int:
+        return await migrate(self.engine, target)
+
     async def drop_tables(self, base):
         async with self.engine.begin() as conn:
             await conn.run_sync(base.metadata.drop_all)
 
     def session(self) -> async_sessionmaker[AsyncSession]:
-        return async_sessionmaker(self.engine, expire_on_commit=False)
\ No newline at end of file
+        return async_sessionmaker(self.engine, expire_on_commit=False)
+
+    def pool_stats(self) -> dict:
+        return self.metrics.snapshot(self.engine.pool)
+
+    def log_pool_stats(self):
+        logger.info(f'Pool stats: {self.pool_stats()}')
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import select, insert, func, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from database.model import Base, MigrationsTable
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock, чтобы два процесса не применяли миграции одновременно
+_LOCK_KEY = 7_340_117
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    statements: tuple[str, ...]
+
+
+'''
+    Миграции применяются по порядку версий и никогда не удаляют данные.
+    Новые миграции добавляются только в конец списка с версией больше последней.
+'''
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        name='performance indexes',
+        statements=(
+            'CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)',
+            'CREATE INDEX IF NOT EXISTS ix_users_join ON users ("join")',
+            'CREATE INDEX IF NOT EXISTS ix_users_entry ON users (entry)',
+            'CREATE INDEX IF NOT EXISTS ix_users_activity ON users (activity)',
+            'CREATE INDEX IF NOT EXISTS ix_users_active ON users (active)',
+            'CREATE INDEX IF NOT EXISTS ix_users_active_user_id ON users (user_id) WHERE active = 1',
+            'CREATE INDEX IF NOT EXISTS ix_deeplinks_link ON deeplinks (link)',
+            'CREATE INDEX IF NOT EXISTS ix_links_link ON links (link)',
+            'CREATE INDEX IF NOT EXISTS ix_admins_user_id ON admins (user_id)',
+        )
+    ),
+    Migration(
+        version=2,
+        name='seed revenue rollups from legacy counters',
+        statements=(
+            # Накопленный до журнала платежей доход переносится одной строкой на 1970-01-01:
+            # он попадает в "за все время", а счетчики периодов начинают считаться с журнала
+            """
+            INSERT INTO daily_rollups (deeplink, day, purchases, revenue)
+            SELECT link, DATE '1970-01-01', 0, SUM(earned) FROM deeplinks WHERE earned > 0 GROUP BY link
+            ON CONFLICT DO NOTHING
+            """,
+            """
+            INSERT INTO daily_rollups (deeplink, day, purchases, revenue)
+            SELECT '', DATE '1970-01-01', 0, total - (SELECT COALESCE(SUM(earned), 0) FROM deeplinks)
+            FROM static WHERE total > 0
+            ON CONFLICT DO NOTHING
+            """,
+        )
+    ),
+    Migration(
+        version=3,
+        name='user and generation counters in daily rollups',
+        statements=(
+            'ALTER TABLE daily_rollups ADD COLUMN IF NOT EXISTS new_users INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE daily_rollups ADD COLUMN IF NOT EXISTS active_users INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE daily_rollups ADD COLUMN IF NOT EXISTS generations INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE daily_rollups ALTER COLUMN purchases SET DEFAULT 0',
+            'ALTER TABLE daily_rollups ALTER COLUMN revenue SET DEFAULT 0',
+            # Прирост пользователей за прошлые дни восстанавливается из users.entry,
+            # дальше роллап продолжает с текущего максимального id
+            """
+            INSERT INTO daily_rollups (deeplink, day, new_users)
+            SELECT COALESCE("join", ''), CAST(entry AS DATE), COUNT(*) FROM users GROUP BY 1, 2
+            ON CONFLICT (deeplink, day) DO UPDATE SET new_users = excluded.new_users
+            """,
+            """
+            INSERT INTO watermarks (name, last_id) SELECT 'users', COALESCE(MAX(id), 0) FROM users
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+            """,
+        )
+    ),
+    Migration(
+        version=4,
+        name='daily totals across deeplinks',
+        statements=(
+            'CREATE INDEX IF NOT EXISTS ix_daily_rollups_day ON daily_rollups (day)',
+            # Таблицу daily_totals создает create_all, здесь она заполняется из уже свернутых агрегатов
+            """
+            INSERT INTO daily_totals (day, new_users, active_users, purchases, revenue, generations)
+            SELECT day, SUM(new_users), SUM(active_users), SUM(purchases), SUM(revenue), SUM(generations)
+            FROM daily_rollups GROUP BY day
+            ON CONFLICT (day) DO UPDATE SET new_users = excluded.new_users, active_users = excluded.active_users,
+                purchases = excluded.purchases, revenue = excluded.revenue, generations = excluded.generations
+            """,
+        )
+    ),
+]
+
+
+async def _current_version(conn: AsyncConnection) -> int:
+    return await conn.scalar(select(func.coalesce(func.max(MigrationsTable.version), 0)))
+
+
+async def _lock(conn: AsyncConnection):
+    """Блокировка до конца транзакции: DDL и миграции не выполняются двумя процессами одновременно"""
+    await conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _LOCK_KEY})
+
+
+async def get_version(engine: AsyncEngine) -> int:
+    async with engine.begin() as conn:
+        await _lock(conn)
+        await conn.run_sync(Base.metadata.create_all, tables=[MigrationsTable.__table__])
+        return await _current_version(conn)
+
+
+async def migrate(engine: AsyncEngine, target: int | None = None) -> int:
+    """Применяет все неприменённые миграции до target (по умолчанию до последней) и возвращает текущую версию"""
+    async with engine.begin() as conn:
+        await _lock(conn)
+        await conn.run_sync(Base.metadata.create_all)
+        version = await _current_version(conn)
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        async with engine.begin() as conn:
+            await _lock(conn)
+            version = await _current_version(conn)
+            if migration.version <= version:
+                continue
+            logger.info(f'Применяется миграция {migration.version}: {migration.name}')
+            for statement in migration.statements:
+                await conn.execute(text(statement))
+            await conn.execute(insert(MigrationsTable).values(
+                version=migration.version,
+                name=migration.name
+            ))
+            version = migration.version
+    return version
+
+
+async def _main():
+    from config_data.config import load_config
+
+    parser = argparse.ArgumentParser(description='Миграции базы данных')
+    parser.add_argument('command', choices=['upgrade', 'current'])
+    parser.add_argument('--target', type=int, default=None, help='версия, до которой применить миграции')
+    args = parser.parse_args()
+
+    engine = create_async_engine(load_config().db.dns)
+    try:
+        if args.command == 'upgrade':
+            version = await migrate(engine, args.target)
+        else:
+            version = await get_version(engine)
+        print(f'Текущая версия схемы: {version}')
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -1,7 +1,7 @@
 import datetime
 from typing import Literal
 
-from sqlalchemy import BigInteger, VARCHAR, ForeignKey, DateTime, Boolean, Column, Integer, String, func
+from sqlalchemy import BigInteger, VARCHAR, ForeignKey, DateTime, Date, Boolean, Column, Integer, String, Index, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
@@ -12,10 +12,14 @@ class Base(AsyncAttrs, DeclarativeBase):
 
 class UsersTable(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Частичный индекс для рассылок: обходим только тех, кто не заблокировал бота
+        Index('ix_users_active_user_id', 'user_id', postgresql_where=text('active = 1')),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
-    username: Mapped[str] = mapped_column(VARCHAR)
+    username: Mapped[str] = mapped_column(VARCHAR, index=True)
     name: Mapped[str] = mapped_column(VARCHAR)
     user_id: Mapped[int] = mapped_column(BigInteger, unique=True)
 
@@ -26,14 +30,14 @@ class UsersTable(Base):
     refs: Mapped[int] = mapped_column(Integer, default=0)
     revives_earn: Mapped[int] = mapped_column(Integer, default=0)
 
-    join: Mapped[str] = mapped_column(VARCHAR, default=None, nullable=True)
+    join: Mapped[str] = mapped_column(VARCHAR, default=None, nullable=True, index=True)
 
     restores_count: Mapped[int] = mapped_column(Integer, default=0)
     revives_count: Mapped[int] = mapped_column(Integer, default=0)
 
-    active: Mapped[int] = mapped_column(Integer, default=1)
-    activity: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.now())
-    entry: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.now())
+    active: Mapped[int] = mapped_column(Integer, default=1, index=True)
+    activity: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.now(), index=True)
+    entry: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.now(), index=True)
 
 
 class DeeplinksTable(Base):
@@ -42,10 +46,12 @@ class DeeplinksTable(Base):
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
     name: Mapped[str] = mapped_column(VARCHAR)
-    link: Mapped[str] = mapped_column(VARCHAR)
+    link: Mapped[str] = mapped_column(VARCHAR, index=True)
 
     entry: Mapped[int] = mapped_column(BigInteger, default=0)
 
+    # Устаревшие счетчики дохода: приложение их больше не пишет, доход считается по payments и daily_rollups.
+    # Колонки остаются ради миграции 2, которая переносит накопленный доход в агрегаты
     earned: Mapped[int] = mapped_column(Integer, default=0)
     today: Mapped[int] = mapped_column(Integer, default=0)
     week: Mapped[int] = mapped_column(Integer, default=0)
@@ -69,7 +75,7 @@ class AdminsTable(Base):
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
-    user_id: Mapped[int] = mapped_column(BigInteger)
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
     name: Mapped[str] = mapped_column(VARCHAR)
 
 
@@ -78,10 +84,14 @@ class OneTimeLinksIdsTable(Base):
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
 
-    link: Mapped[str] = mapped_column(VARCHAR)
+    link: Mapped[str] = mapped_column(VARCHAR, index=True)
 
 
 class StaticTable(Base):
+    """
+    Устаревшая общая статистика дохода: приложение ее больше не обновляет и не читает.
+    Таблица остается ради миграции 2, которая переносит накопленный total в daily_rollups
+    """
     __tablename__ = 'static'
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
@@ -91,3 +101,71 @@ class StaticTable(Base):
     week: Mapped[int] = mapped_column(Integer, default=0)
     month: Mapped[int] = mapped_column(Integer, default=0)
 
+
+class PaymentsTable(Base):
+    __tablename__ = 'payments'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    amount: Mapped[int] = mapped_column(Integer)
+    rate: Mapped[Literal['restore', 'revive']] = mapped_column(VARCHAR)
+    count: Mapped[int] = mapped_column(Integer)
+    provider: Mapped[str] = mapped_column(VARCHAR)
+    deeplink: Mapped[str] = mapped_column(VARCHAR, default=None, nullable=True)
+
+    # Время вставки, а не начала транзакции: по нему роллап понимает, какие платежи уже точно зафиксированы
+    create: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.clock_timestamp())
+
+
+class GenerationsTable(Base):
+    __tablename__ = 'generations'
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    kind: Mapped[Literal['restore', 'revive']] = mapped_column(VARCHAR)
+
+    create: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.clock_timestamp())
+
+
+class DailyRollupsTable(Base):
+    __tablename__ = 'daily_rollups'
+
+    # Пустая строка - платежи без диплинка
+    deeplink: Mapped[str] = mapped_column(VARCHAR, primary_key=True, default='')
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True, index=True)
+
+    new_users: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    active_users: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    purchases: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    revenue: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    generations: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
+
+class DailyTotalsTable(Base):
+    """Суммы daily_rollups по всем диплинкам: общая статистика читает одну строку на день"""
+    __tablename__ = 'daily_totals'
+
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+
+    new_users: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    active_users: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    purchases: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+    revenue: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+    generations: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+
+
+class WatermarksTable(Base):
+    __tablename__ = 'watermarks'
+
+    name: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    last_id: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class MigrationsTable(Base):
+    __tablename__ = 'migrations'
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(VARCHAR)
+    applied: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=False), default=func.now())
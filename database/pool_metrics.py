@@ -0,0 +1,95 @@
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.util.queue import Empty
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+
+class PoolMetrics:
+    """Счетчики пула соединений: ожидание выдачи соединения, число выдач и возраст соединений"""
+    # Верхние границы корзин гистограммы ожидания, в секундах
+    WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self._connected: dict[int, float] = {}
+
+    def observe_wait(self, seconds: float):
+        self.wait_count += 1
+        self.wait_sum += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.wait_histogram[bisect_left(self.WAIT_BUCKETS, seconds)] += 1
+
+    def attach(self, pool: Pool):
+        event.listen(pool, 'connect', self._on_connect)
+        event.listen(pool, 'checkout', self._on_checkout)
+        event.listen(pool, 'close', self._on_close)
+        event.listen(pool, 'detach', self._on_close)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self._connected[id(connection_record)] = time.monotonic()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def _on_close(self, dbapi_connection, connection_record):
+        self._connected.pop(id(connection_record), None)
+
+    def snapshot(self, pool: Pool) -> dict:
+        now = time.monotonic()
+        ages = [now - connected for connected in self._connected.values()]
+        labels = [f'<={bucket}s' for bucket in self.WAIT_BUCKETS] + [f'>{self.WAIT_BUCKETS[-1]}s']
+        return {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_avg': self.wait_sum / self.wait_count if self.wait_count else 0.0,
+            'wait_max': self.wait_max,
+            'wait_histogram': dict(zip(labels, self.wait_histogram)),
+            'connections': len(ages),
+            'connection_age_avg': sum(ages) / len(ages) if ages else 0.0,
+            'connection_age_max': max(ages, default=0.0),
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который замеряет время ожидания свободного соединения.
+    Замеряется только выдача из очереди: открытие нового соединения ожиданием не считается
+    """
+    metrics: PoolMetrics | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        get = self._pool.get
+
+        def timed_get(block: bool = True, timeout: float | None = None):
+            if self.metrics is None:
+                return get(block, timeout)
+            start = time.perf_counter()
+            try:
+                connection = get(block, timeout)
+            except Empty:
+                # Без ожидания пустая очередь значит, что пул откроет новое соединение
+                if block:
+                    self.metrics.timeouts += 1
+                    self.metrics.observe_wait(time.perf_counter() - start)
+                raise
+            self.metrics.observe_wait(time.perf_counter() - start if block else 0.0)
+            return connection
+
+        self._pool.get = timed_get
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
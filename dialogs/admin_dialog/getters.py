@@ -16,47 +16,35 @@ from config_data.config import load_config, Config
 from states.state_groups import startSG, adminSG
 
 
+DEEPLINKS_PAGE_SIZE = 10
+
+
+def _rollup_value(rollups: dict, days_ago: int, column: str) -> int:
+    day = datetime.date.today() - datetime.timedelta(days=days_ago)
+    return getattr(rollups[day], column) if day in rollups else 0
+
+
 async def get_static(clb: CallbackQuery, widget: Button, dialog_manager: DialogManager):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
-    users = await session.get_users()
-    active = 0
-    entry = {
-        'today': 0,
-        'yesterday': 0,
-        '2_day_ago': 0
-    }
-    activity = 0
-    for user in users:
-        if user.active:
-            active += 1
-        for day in range(0, 3):
-            #print(user.entry.date(), (datetime.datetime.today() - datetime.timedelta(days=day)).date())
-            if user.entry.date() == (datetime.datetime.today() - datetime.timedelta(days=day)).date():
-                if day == 0:
-                    entry['today'] = entry.get('today') + 1
-                elif day == 1:
-                    entry['yesterday'] = entry.get('yesterday') + 1
-                else:
-                    entry['2_day_ago'] = entry.get('2_day_ago') + 1
-        if user.activity.timestamp() > (datetime.datetime.today() - datetime.timedelta(days=1)).timestamp():
-            activity += 1
-
-    static = await session.get_static()
-
-    text = (f'<b>Статистика на {datetime.datetime.today().strftime("%d-%m-%Y")}</b>\n\nВсего пользователей: {len(users)}'
-            f'\n - Активные пользователи(не заблокировали бота): {active}\n - Пользователей заблокировали '
-            f'бота: {len(users) - active}\n - Провзаимодействовали с ботом за последние 24 часа: {activity}\n\n'
-            f'<b>Прирост аудитории:</b>\n - За сегодня: +{entry.get("today")}\n - Вчера: +{entry.get("yesterday")}'
-            f'\n - Позавчера: + {entry.get("2_day_ago")}\n\n<b>Доход</b>:\n - За сегодня: {static.today}₽'
-            f'\n - За неделю: {static.week}₽\n - За месяц: {static.month}₽\n - За все время: {static.total}₽')
+    users = await session.get_users_static()
+    income = await session.get_income()
+    rollups = await session.get_rollups()
+
+    text = (f'<b>Статистика на {datetime.datetime.today().strftime("%d-%m-%Y")}</b>\n\nВсего пользователей: {users.total}'
+            f'\n - Активные пользователи(не заблокировали бота): {users.active}\n - Пользователей заблокировали '
+            f'бота: {users.total - users.active}\n - Провзаимодействовали с ботом за последние 24 часа: {users.activity}\n\n'
+            f'<b>Прирост аудитории:</b>\n - За сегодня: +{_rollup_value(rollups, 0, "new_users")}\n - Вчера: '
+            f'+{_rollup_value(rollups, 1, "new_users")}\n - Позавчера: + {_rollup_value(rollups, 2, "new_users")}\n\n'
+            f'<b>Генерации:</b>\n - За сегодня: {_rollup_value(rollups, 0, "generations")}\n - Вчера: '
+            f'{_rollup_value(rollups, 1, "generations")}\n\n<b>Доход</b>:\n - За сегодня: {income.today}₽'
+            f'\n - За неделю: {income.week}₽\n - За месяц: {income.month}₽\n - За все время: {income.total}₽')
     await clb.message.answer(text=text)
 
 
 async def get_users_txt(clb: CallbackQuery, widget: Button, dialog_manager: DialogManager):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
-    users = await session.get_users()
     with open('users.txt', 'a+') as file:
-        for user in users:
+        async for user in session.iter_users('user_id'):
             file.write(f'{user.user_id}\n')
     await clb.message.answer_document(
         document=FSInputFile(path='users.txt')
@@ -108,50 +96,55 @@ async def get_delivery_amount(msg: Message, widget: ManagedTextInput, dialog_man
 
 async def deeplinks_menu_getter(dialog_manager: DialogManager, **kwargs):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
-    buttons = dialog_manager.dialog_data.get('deeplinks')
-    if not buttons:
-        links = await session.get_deeplinks()
-        buttons = [(f'{link.name} ({link.entry})', link.id) for link in links]
-        buttons = [buttons[i:i + 10] for i in range(0, len(buttons), 10)]
-        dialog_manager.dialog_data['deeplinks'] = buttons
-    page = dialog_manager.dialog_data.get('page')
-    if not page:
-        page = 0
-        dialog_manager.dialog_data['page'] = page
-    not_first = False
-    not_last = False
-    if page != 0:
-        not_first = True
-    if len(buttons) and page != len(buttons) - 1:
-        not_last = True
-    print(buttons)
+    # В dialog_data хранится только курсор: номер страницы и id, после которого она начинается
+    page = dialog_manager.dialog_data.get('page', 0)
+    links = await session.get_deeplinks_page(
+        after=dialog_manager.dialog_data.get('deeplinks_after'),
+        limit=DEEPLINKS_PAGE_SIZE
+    )
+    total = await session.get_deeplinks_count()
+    pages = max((total + DEEPLINKS_PAGE_SIZE - 1) // DEEPLINKS_PAGE_SIZE, 1)
+    dialog_manager.dialog_data['page'] = page
+    dialog_manager.dialog_data['deeplinks_first'] = links[0].id if links else None
+    dialog_manager.dialog_data['deeplinks_last'] = links[-1].id if links else None
     return {
-        'items': buttons[page] if buttons else [],
-        'page': f'{page + 1}/{len(buttons)}',
-        'not_first': not_first,
-        'not_last': not_last
+        'items': [(f'{link.name} ({link.entry + session.pending("entry", link.link)})', link.id) for link in links],
+        'page': f'{page + 1}/{pages}',
+        'deeplinks': bool(links),
+        'not_first': page != 0,
+        'not_last': page + 1 < pages and len(links) == DEEPLINKS_PAGE_SIZE
     }
 
 
 async def deeplinks_pager(clb: CallbackQuery, widget: Button, dialog_manager: DialogManager):
+    session: DataInteraction = dialog_manager.middleware_data.get('session')
     page = dialog_manager.dialog_data.get('page')
     action = clb.data.split('_')[0]
     if action == 'back':
-        page -= 1
+        first = dialog_manager.dialog_data.get('deeplinks_first')
+        previous = await session.get_deeplinks_page(before=first, limit=DEEPLINKS_PAGE_SIZE) if first is not None else []
+        if len(previous) < DEEPLINKS_PAGE_SIZE:
+            # Страница опустела (диплинки удалили) или перед ней неполная страница: возвращаемся в начало
+            page, after = 0, None
+        else:
+            page = max(page - 1, 0)
+            after = previous[0].id - 1 if page else None
     else:
         page += 1
+        after = dialog_manager.dialog_data.get('deeplinks_last')
     dialog_manager.dialog_data['page'] = page
+    dialog_manager.dialog_data['deeplinks_after'] = after
     await dialog_manager.switch_to(adminSG.deeplinks_menu)
 
 
+def _reset_deeplinks_cursor(dialog_manager: DialogManager):
+    for key in ('page', 'deeplinks_after', 'deeplinks_first', 'deeplinks_last'):
+        dialog_manager.dialog_data.pop(key, None)
+
+
 async def get_deeplink_name(msg: Message, widget: ManagedTextInput, dialog_manager: DialogManager, text: str):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
     await session.add_deeplink(get_random_id(), text)
-    links = await session.get_deeplinks()
-    buttons = [(f'{link.name} ({link.entry})', link.id) for link in links]
-    buttons = [buttons[i:i + 10] for i in range(0, len(buttons), 10)]
-    print(buttons)
-    dialog_manager.dialog_data['deeplinks'] = buttons
     await dialog_manager.switch_to(adminSG.deeplinks_menu)
 
 
@@ -164,34 +157,16 @@ async def deeplink_menu_getter(dialog_manager: DialogManager, **kwargs):
     deeplink_id = dialog_manager.dialog_data.get('deeplink_id')
     session: DataInteraction = dialog_manager.middleware_data.get('session')
     deeplink = await session.get_deeplink(deeplink_id)
-    users = [user for user in await session.get_users() if user.join and user.join == deeplink.link]
-    active = 0
-    entry = {
-        'today': 0,
-        'yesterday': 0,
-        '2_day_ago': 0
-    }
-    activity = 0
-    for user in users:
-        if user.active:
-            active += 1
-        for day in range(0, 3):
-            #print(user.entry.date(), (datetime.datetime.today() - datetime.timedelta(days=day)).date())
-            if user.entry.date() == (datetime.datetime.now() - datetime.timedelta(days=day)).date():
-                if day == 0:
-                    entry['today'] = entry.get('today') + 1
-                elif day == 1:
-                    entry['yesterday'] = entry.get('yesterday') + 1
-                else:
-                    entry['2_day_ago'] = entry.get('2_day_ago') + 1
-        if user.activity.timestamp() > (datetime.datetime.today() - datetime.timedelta(days=1)).timestamp():
-            activity += 1
-
-    text = (f'<b>({deeplink.name}) 🗓 Cоздано: {datetime.datetime.today().strftime("%d-%m-%Y")}</b>\n\nОбщее:\nВсего: {len(users)}'
-            f'\n - Активны: {active}\n - Заблокировали бота: {len(users) - active}\n'
-            f' - Заходили в бота последние сутки: {activity}\n\nРост:\n - За сегодня: +{entry.get("today")}\n'
-            f' - Вчера: +{entry.get("yesterday")}\n - Позавчера: + {entry.get("2_day_ago")}\n\nЗаработано:\n'
-            f' - Всего: {deeplink.earned}₽\n - За сегодня: {deeplink.today}₽\n - За неделю: {deeplink.week}₽\n\n'
+    users = await session.get_users_static(join=deeplink.link)
+    income = await session.get_income(deeplink.link)
+    rollups = await session.get_rollups(deeplink.link)
+
+    text = (f'<b>({deeplink.name}) 🗓 Cоздано: {datetime.datetime.today().strftime("%d-%m-%Y")}</b>\n\nОбщее:\nВсего: {users.total}'
+            f'\n - Активны: {users.active}\n - Заблокировали бота: {users.total - users.active}\n'
+            f' - Заходили в бота последние сутки: {users.activity}\n\nРост:\n - За сегодня: +{_rollup_value(rollups, 0, "new_users")}\n'
+            f' - Вчера: +{_rollup_value(rollups, 1, "new_users")}\n - Позавчера: + {_rollup_value(rollups, 2, "new_users")}'
+            f'\n\nЗаработано:\n'
+            f' - Всего: {income.total}₽\n - За сегодня: {income.today}₽\n - За неделю: {income.week}₽\n\n'
             f'<b>🔗 Ссылка:</b> <code>https://t.me/Fotovmagic_bot?start={deeplink.link}</code>')
     return {'text': text}
 
@@ -203,11 +178,7 @@ async def del_deeplink(clb: CallbackQuery, widget: Button, dialog_manager: Dialo
 
     await clb.answer('Данный диплинк был успешно удален')
 
-    links = await session.get_deeplinks()
-    buttons = [(f'{link.name} ({link.entry})', link.id) for link in links]
-    buttons = [buttons[i:i + 10] for i in range(0, len(buttons), 10)]
-    dialog_manager.dialog_data['deeplinks'] = buttons
-    dialog_manager.dialog_data['page'] = 0
+    _reset_deeplinks_cursor(dialog_manager)
     dialog_manager.dialog_data['deeplink_id'] = None
     await dialog_manager.switch_to(adminSG.deeplinks_menu)
 
@@ -385,11 +356,10 @@ async def start_malling(clb: CallbackQuery, widget: Button, dialog_manager: Dial
     keyboard = dialog_manager.dialog_data.get('keyboard')
     if keyboard:
         keyboard = [InlineKeyboardButton(text=i[0], url=i[1]) for i in keyboard]
-    users = await session.get_users()
     if not time:
         if dialog_manager.dialog_data.get('text'):
             text: str = dialog_manager.dialog_data.get('text')
-            for user in users:
+            async for user in session.iter_users('user_id', 'name', 'active'):
                 try:
                     await bot.send_message(
                         chat_id=user.user_id,
@@ -404,7 +374,7 @@ async def start_malling(clb: CallbackQuery, widget: Button, dialog_manager: Dial
         elif dialog_manager.dialog_data.get('caption'):
             caption: str = dialog_manager.dialog_data.get('caption')
             if dialog_manager.dialog_data.get('photo'):
-                for user in users:
+                async for user in session.iter_users('user_id', 'name', 'active'):
                     try:
                         await bot.send_photo(
                             chat_id=user.user_id,
@@ -418,7 +388,7 @@ async def start_malling(clb: CallbackQuery, widget: Button, dialog_manager: Dial
                         print(err)
                         await session.set_active(user.user_id, 0)
             else:
-                for user in users:
+                async for user in session.iter_users('user_id', 'name', 'active'):
                     try:
                         await bot.send_video(
                             chat_id=user.user_id,
@@ -436,7 +406,7 @@ async def start_malling(clb: CallbackQuery, widget: Button, dialog_manager: Dial
         date = date.replace(year=datetime.datetime.today().year)
         scheduler.add_job(
             func=send_messages,
-            args=[bot, session, InlineKeyboardMarkup(inline_keyboard=[keyboard]) if keyboard else None],
+            args=[bot, session.detached(), InlineKeyboardMarkup(inline_keyboard=[keyboard]) if keyboard else None],
             kwargs={
                 'text': dialog_manager.dialog_data.get('text'),
                 'caption': dialog_manager.dialog_data.get('caption'),
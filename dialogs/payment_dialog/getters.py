@@ -25,8 +25,8 @@ async def choose_rate_type(clb: CallbackQuery, widget: Button, dialog_manager: D
 async def choose_rate_getter(event_from_user: User, dialog_manager: DialogManager, **kwargs):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
     rate_type = dialog_manager.dialog_data.get('rate')
-    rates = await session.get_rates()
-    buttons = [(f'{rate.amount} - {rate.cost}₽ {rate.text if rate.text else ""}', rate.id) for rate in rates if rate.rate == rate_type]
+    rates = await session.get_rates_by_type(rate_type)
+    buttons = [(f'{rate.amount} - {rate.cost}₽ {rate.text if rate.text else ""}', rate.id) for rate in rates]
     return {
         'rate': 'реставраций' if rate_type == 'restore' else 'оживлений',
         'items': buttons
@@ -46,11 +46,9 @@ async def choose_payment_getter(dialog_manager: DialogManager, **kwargs):
     cost = dialog_manager.dialog_data.get('cost')
     rate_type = dialog_manager.dialog_data.get('rate')
 
-    usdt = dialog_manager.dialog_data.get('usdt')
-    if not usdt:
-        usdt_rub = await _get_usdt_rub()
-        usdt = round(cost / (usdt_rub), 2)
-        dialog_manager.dialog_data['usdt'] = usdt
+    usdt_rub = await _get_usdt_rub()
+    usdt = round(cost / (usdt_rub), 2)
+    dialog_manager.dialog_data['usdt'] = usdt
 
     text = (f'<em>Сумма к оплате: <b>{cost}₽ ({usdt}$)</b>\n'
             f'Покупка: <b>{amount}</b> {get_rate_form(amount, rate_type)}</em>')
@@ -74,7 +72,7 @@ async def payment_choose(clb: CallbackQuery, widget: Button, dialog_manager: Dia
                 payment_id=payment.get('id'),
                 user_id=clb.from_user.id,
                 bot=clb.bot,
-                session=session,
+                session=session.detached(),
                 amount=amount,
                 cost=cost,
                 rate_type=rate_type,
@@ -95,7 +93,7 @@ async def payment_choose(clb: CallbackQuery, widget: Button, dialog_manager: Dia
                 payment_id=payment.get('id'),
                 user_id=clb.from_user.id,
                 bot=clb.bot,
-                session=session,
+                session=session.detached(),
                 amount=amount,
                 cost=cost,
                 rate_type=rate_type,
@@ -17,11 +17,7 @@ config: Config = load_config()
 
 async def start_getter(event_from_user: User, dialog_manager: DialogManager, **kwargs):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
-    admin = False
-    admins = [*config.bot.admin_ids]
-    admins.extend([admin.user_id for admin in await session.get_admins()])
-    if event_from_user.id in admins:
-        admin = True
+    admin = event_from_user.id in config.bot.admin_ids or event_from_user.id in await session.get_admin_ids()
     return {
         'full_name': event_from_user.full_name,
         'admin': admin
@@ -52,8 +48,7 @@ async def get_restore_photo(msg: Message, widget: MessageInput, dialog_manager:
         dialog_manager.dialog_data.clear()
         await dialog_manager.switch_to(startSG.start)
         return
-    await session.increment_user_value(msg.from_user.id, 'restores', -1)
-    await session.increment_user_value(msg.from_user.id, 'restores_count', 1)
+    await session.add_generation(msg.from_user.id, 'restore')
     dialog_manager.dialog_data['media'] = result
     await dialog_manager.switch_to(startSG.restore_result)
 
@@ -101,8 +96,7 @@ async def revive_action_choose(clb: CallbackQuery, widget: Button, dialog_manage
         await dialog_manager.switch_to(startSG.start)
         return
     print(result)
-    await session.increment_user_value(clb.from_user.id, 'revives', -1)
-    await session.increment_user_value(clb.from_user.id, 'revives_count', 1)
+    await session.add_generation(clb.from_user.id, 'revive')
     dialog_manager.dialog_data['media'] = result
     await dialog_manager.switch_to(startSG.revive_result)
 
@@ -135,8 +129,7 @@ async def get_revive_prompt(msg: Message, widget: ManagedTextInput, dialog_manag
         await dialog_manager.switch_to(startSG.start)
         return
     print(result)
-    await session.increment_user_value(msg.from_user.id, 'revives', -1)
-    await session.increment_user_value(msg.from_user.id, 'revives_count', 1)
+    await session.add_generation(msg.from_user.id, 'revive')
     dialog_manager.dialog_data['media'] = result
     await dialog_manager.switch_to(startSG.revive_result)
 
@@ -171,9 +164,10 @@ async def manual_getter(event_from_user: User, dialog_manager: DialogManager, **
 async def ref_menu_getters(event_from_user: User, dialog_manager: DialogManager, **kwargs):
     session: DataInteraction = dialog_manager.middleware_data.get('session')
     user = await session.get_user(event_from_user.id)
+    refs = user.refs + session.pending('refs', user.user_id)
     text = (f'<b>🎁 Реферальная программа</b>\n\n<b>❓Как получить бесплатно оживление:</b>\nПригласите друга по '
             f'Вашей ссылке. Когда он <b>пополнит свой</b> баланс, вам автоматически начислится бонус в виде 1-го '
-            f'оживления.\n\n<b>📊 Ваша статистика:</b>\n👥 Всего приглашено: {user.refs}\n'
+            f'оживления.\n\n<b>📊 Ваша статистика:</b>\n👥 Всего приглашено: {refs}\n'
             f'🫰 Всего получено оживлений: {user.revives_earn}\n\n🎞Оживлений на балансе: {user.revives}'
             f'\n\n🔗Ваша реферальная ссылка:\n<code>https://t.me/Fotovmagic_bot?start={user.user_id}</code>'
             f'\n\n<em>Поделитесь ссылкой и получите одно оживление бесплатно!</em>')
@@ -16,27 +16,22 @@ async def start_dialog(msg: Message, dialog_manager: DialogManager, session: Dat
     referral = None
     link = None
     if args:
-        link_ids = await session.get_links()
-        ids = [i.link for i in link_ids]
-        if args in ids:
+        if await session.get_link(args):
             await session.add_admin(msg.from_user.id, msg.from_user.full_name)
             await session.del_link(args)
-        if not await session.check_user(msg.from_user.id):
-            deeplinks = await session.get_deeplinks()
-            deep_list = [i.link for i in deeplinks]
-            if args in deep_list:
-                link = args
-                await session.add_entry(args)
-            try:
-                args = int(args)
-                users = [user.user_id for user in await session.get_users()]
-                if args in users:
-                    referral = args
-                    await session.add_refs(args)
-            except Exception as err:
-                print(err)
-    await session.add_user(msg.from_user.id, msg.from_user.username if msg.from_user.username else 'Отсутствует',
-                           msg.from_user.full_name, referral=referral, link=link)
+        if await session.get_deeplink_by_link(args):
+            link = args
+        try:
+            if await session.check_user(int(args)):
+                referral = int(args)
+        except Exception as err:
+            print(err)
+    is_new = await session.add_user(msg.from_user.id, msg.from_user.username if msg.from_user.username else 'Отсутствует',
+                                    msg.from_user.full_name, referral=referral, link=link)
+    if is_new and link:
+        await session.add_entry(link)
+    if is_new and referral:
+        await session.add_refs(referral)
     if dialog_manager.has_context():
         await dialog_manager.done()
         try:
@@ -5,7 +5,7 @@ from aiogram import BaseMiddleware, Bot
 from aiogram.types import TelegramObject, User
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from database.action_data_class import DataInteraction
+from database.buffers import ActivityBuffer
 from config_data.config import load_config, Config
 
 config: Config = load_config()
@@ -24,8 +24,8 @@ class RemindMiddleware(BaseMiddleware):
         if user is None:
             return await handler(event, data)
 
-        session: DataInteraction = data.get('session')
-        await session.set_activity(user_id=user.id)
+        activity: ActivityBuffer = data.get('_activity')
+        activity.touch(user.id)
 
         result = await handler(event, data)
         return result
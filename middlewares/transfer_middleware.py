@@ -7,11 +7,16 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from database.action_data_class import DataInteraction
+from database.buffers import CounterBuffer
 
 logger = logging.getLogger(__name__)
 
 
 class TransferObjectsMiddleware(BaseMiddleware):
+    def __init__(self, shared_session: bool = False):
+        # Одна сессия и кэш пользователей на весь апдейт вместо новой сессии на каждый запрос
+        self.shared_session = shared_session
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -26,8 +31,14 @@ class TransferObjectsMiddleware(BaseMiddleware):
 
         sessions: async_sessionmaker = data.get('_session')
         scheduler: AsyncIOScheduler = data.get('_scheduler')
+        counters: CounterBuffer = data.get('_counters')
 
-        interaction = DataInteraction(sessions)
-        data['session'] = interaction
         data['scheduler'] = scheduler
+        if self.shared_session:
+            async with DataInteraction.request_scope(sessions, counters) as interaction:
+                data['session'] = interaction
+                return await handler(event, data)
+
+        interaction = DataInteraction(sessions, counters=counters)
+        data['session'] = interaction
         return await handler(event, data)
\ No newline at end of file
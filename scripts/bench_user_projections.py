@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database.action_data_class import DataInteraction, _users_projection
+from database.model import Base, UsersTable
+
+
+'''
+    Сравнивает способы чтения пользователей для рассылок и выгрузок: ORM-объекты, выборку колонок через ORM
+    и Core, обход iter_users. Таблица заполняется во временной схеме, которая удаляется после замера.
+    Запуск: python -m scripts.bench_user_projections --rows 100000 [--url postgresql+asyncpg://...]
+
+    Результаты: локальный Postgres 16.2, SQLAlchemy 2.0.54, asyncpg 0.32.0, Python 3.11
+    100000 rows, columns: user_id, name, active
+      ORM entities                    2.18s     164.8 MiB
+      ORM column select, list         0.28s      37.1 MiB
+      Core column select, list        0.17s      31.0 MiB
+      iter_users, keyset chunks       0.22s       0.6 MiB
+    1000000 rows, columns: user_id, name, active
+      ORM entities                   18.51s    1642.3 MiB
+      ORM column select, list         3.69s     371.3 MiB
+      Core column select, list        2.00s     309.8 MiB
+      iter_users, keyset chunks       2.68s       0.7 MiB
+'''
+_SCHEMA = 'bench_user_projections'
+_COLUMNS = ('user_id', 'name', 'active')
+
+
+async def _orm_entities(sessions: async_sessionmaker) -> int:
+    async with sessions() as session:
+        result = await session.scalars(select(UsersTable))
+        return len(result.all())
+
+
+async def _orm_columns(sessions: async_sessionmaker) -> int:
+    async with sessions() as session:
+        result = await session.execute(select(*[getattr(UsersTable, column) for column in _COLUMNS]))
+        return len(result.all())
+
+
+async def _core_columns(sessions: async_sessionmaker) -> int:
+    async with sessions() as session:
+        connection = await session.connection()
+        result = await connection.execute(_users_projection(_COLUMNS))
+        return len(result.all())
+
+
+async def _iter_users(sessions: async_sessionmaker) -> int:
+    count = 0
+    async for _ in DataInteraction(sessions).iter_users(*_COLUMNS):
+        count += 1
+    return count
+
+
+_CASES = {
+    'ORM entities': _orm_entities,
+    'ORM column select, list': _orm_columns,
+    'Core column select, list': _core_columns,
+    'iter_users, keyset chunks': _iter_users,
+}
+
+
+async def _fill(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(f'DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE'))
+        await conn.execute(text(f'CREATE SCHEMA {_SCHEMA}'))
+        await conn.run_sync(Base.metadata.create_all, tables=[UsersTable.__table__])
+        await conn.execute(text(
+            'INSERT INTO users (username, name, user_id, restores, revives, refs, revives_earn, restores_count, '
+            'revives_count, active, activity, entry) '
+            "SELECT 'user' || g, 'name ' || g, g, 0, 0, 0, 0, 0, 0, g % 2, now(), now() "
+            'FROM generate_series(1, :rows) g'
+        ), {'rows': rows})
+
+
+async def _measure(sessions: async_sessionmaker, case) -> tuple[float, float]:
+    """Время и пик памяти замеряются разными проходами: tracemalloc заметно замедляет выполнение"""
+    start = time.perf_counter()
+    await case(sessions)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    await case(sessions)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description='Замер чтения колонок пользователей')
+    parser.add_argument('--rows', type=int, default=100_000, help='число пользователей в тестовой таблице')
+    parser.add_argument('--url', default=None, help='строка подключения, по умолчанию из конфига')
+    args = parser.parse_args()
+    if args.url is None:
+        from config_data.config import load_config
+        args.url = load_config().db.dns
+
+    engine = create_async_engine(args.url, connect_args={'server_settings': {'search_path': _SCHEMA}})
+    try:
+        await _fill(engine, args.rows)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        print(f'{args.rows} rows, columns: {", ".join(_COLUMNS)}')
+        for name, case in _CASES.items():
+            elapsed, peak = await _measure(sessions, case)
+            print(f'  {name:<28}{elapsed:>8.2f}s {peak:>9.1f} MiB')
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS {_SCHEMA} CASCADE'))
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main())
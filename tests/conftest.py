@@ -0,0 +1,9 @@
+import os
+
+
+# Модули с load_config() на уровне импорта требуют обязательные переменные окружения
+for _name, _value in {
+    'token': 'test', 'admins': '1', 'dns': 'postgresql+asyncpg://test', 'nats': 'nats://test',
+    'account_id': 'test', 'secret_key': 'test', 'oxa_api_key': 'test', 'unifically_api_token': 'test',
+}.items():
+    os.environ.setdefault(_name, _value)
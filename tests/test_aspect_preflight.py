@@ -0,0 +1,64 @@
+from utils.ai_funcs import AspectPreflight
+
+
+# 0.68 в 2% от 2:3, но не совпадает с ним; 1:1 входит в допустимые форматы
+WIDTH, HEIGHT = 680, 1000
+
+
+def _record(preflight: AspectPreflight, variant: str, accepted: int, rejected: int):
+    for _ in range(accepted):
+        preflight.record(WIDTH, HEIGHT, variant, accepted=True)
+    for _ in range(rejected):
+        preflight.record(WIDTH, HEIGHT, variant, accepted=False)
+
+
+def test_default_order():
+    preflight = AspectPreflight()
+    assert preflight.order(WIDTH, HEIGHT) == ['original', 'min-ratio', 'max-ratio']
+    assert preflight.order(1000, 1000) == ['original', 'max-ratio']
+
+
+def test_few_rejections_do_not_reorder():
+    preflight = AspectPreflight()
+    _record(preflight, 'original', accepted=0, rejected=AspectPreflight.MIN_SAMPLES - 1)
+    assert preflight.order(WIDTH, HEIGHT) == ['original', 'min-ratio', 'max-ratio']
+
+
+def test_rejected_original_moves_behind_min_ratio():
+    preflight = AspectPreflight()
+    _record(preflight, 'original', accepted=2, rejected=AspectPreflight.MIN_SAMPLES)
+    assert preflight.order(WIDTH, HEIGHT) == ['min-ratio', 'original', 'max-ratio']
+    # Статистика одной корзины не влияет на другие
+    assert preflight.order(1000, 680) == ['original', 'min-ratio', 'max-ratio']
+
+
+def test_original_stays_first_when_min_ratio_does_no_better():
+    preflight = AspectPreflight()
+    _record(preflight, 'original', accepted=10, rejected=10)
+    _record(preflight, 'min-ratio', accepted=5, rejected=15)
+    assert preflight.order(WIDTH, HEIGHT) == ['original', 'min-ratio', 'max-ratio']
+
+
+def test_max_ratio_is_always_last():
+    preflight = AspectPreflight()
+    _record(preflight, 'original', accepted=0, rejected=50)
+    _record(preflight, 'min-ratio', accepted=0, rejected=50)
+    _record(preflight, 'max-ratio', accepted=50, rejected=0)
+    assert preflight.order(WIDTH, HEIGHT)[-1] == 'max-ratio'
+
+
+def test_out_of_range_photo_is_cropped_first():
+    preflight = AspectPreflight()
+    # 1:3 уже самого узкого допустимого формата 1:2
+    assert preflight.order(300, 900) == ['min-ratio', 'original', 'max-ratio']
+    # 0.6 в пределах диапазона, но почти на 7% дальше от ближайшего 9:16
+    assert preflight.order(600, 1000) == ['min-ratio', 'original', 'max-ratio']
+
+
+def test_out_of_range_original_is_restored_only_by_stats():
+    preflight = AspectPreflight()
+    for _ in range(AspectPreflight.MIN_SAMPLES):
+        preflight.record(300, 900, 'min-ratio', accepted=False)
+    for _ in range(AspectPreflight.MIN_SAMPLES):
+        preflight.record(300, 900, 'original', accepted=True)
+    assert preflight.order(300, 900) == ['original', 'min-ratio', 'max-ratio']
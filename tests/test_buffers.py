@@ -0,0 +1,46 @@
+import asyncio
+
+from database.buffers import CounterBuffer
+
+
+class _Counters:
+    """Заглушка DataInteraction: запоминает, что видел pending() до и после commit"""
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.buffer: CounterBuffer | None = None
+        self.seen: list[int] = []
+
+    async def add_counters(self, entries, refs, on_commit=None):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError('db is down')
+        self.seen.append(self.buffer.pending('entry', 'link'))
+        on_commit()
+        self.seen.append(self.buffer.pending('entry', 'link'))
+        # Закрытие сессии после commit
+        await asyncio.sleep(0)
+
+
+def test_flushed_counters_leave_pending_right_after_commit():
+    async def main():
+        session = _Counters()
+        buffer = session.buffer = CounterBuffer(session)
+        buffer.add('entry', 'link', 3)
+        await buffer.flush()
+        return session.seen, buffer.pending('entry', 'link')
+
+    seen, pending = asyncio.run(main())
+    assert seen == [3, 0]
+    assert pending == 0
+
+
+def test_failed_flush_keeps_counters_pending():
+    async def main():
+        session = _Counters(fail=True)
+        buffer = session.buffer = CounterBuffer(session)
+        buffer.add('entry', 'link', 3)
+        await buffer.flush()
+        buffer.add('entry', 'link')
+        return buffer.pending('entry', 'link')
+
+    assert asyncio.run(main()) == 4
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from utils.cache import AsyncCache
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def main():
+        cache = AsyncCache('test', ttl=None)
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return 'value'
+
+        results = await asyncio.gather(*[cache.get('key', fetch) for _ in range(5)])
+        return results, calls
+
+    results, calls = asyncio.run(main())
+    assert results == ['value'] * 5
+    assert calls == 1
+
+
+def test_waiters_retry_when_leader_is_cancelled():
+    async def main():
+        cache = AsyncCache('test', ttl=None)
+        started = asyncio.Event()
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.01)
+            return calls
+
+        leader = asyncio.create_task(cache.get('key', fetch))
+        await started.wait()
+        waiters = [asyncio.create_task(cache.get('key', fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters), calls
+
+    results, calls = asyncio.run(main())
+    # Один из ожидавших загружает ключ заново, остальные получают его результат
+    assert results == [2, 2, 2]
+    assert calls == 2
+
+
+def test_fetch_error_reaches_waiters_and_is_not_cached():
+    async def main():
+        cache = AsyncCache('test', ttl=None)
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        results = await asyncio.gather(*[cache.get('key', failing) for _ in range(3)], return_exceptions=True)
+
+        async def fetch():
+            return 'value'
+
+        return results, await cache.get('key', fetch)
+
+    results, value = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert value == 'value'
@@ -1,9 +1,9 @@
-import os
 import logging
 import asyncio
 import aiohttp
 import base64
-from pathlib import Path
+from io import BytesIO
+from contextlib import asynccontextmanager
 from aiohttp import ClientTimeout
 
 from PIL import Image
@@ -11,6 +11,9 @@ from aiogram import Bot
 from aiogram.types import PhotoSize
 
 from config_data.config import Config, load_config
+from utils.http_clients import get_client, UNIFICALLY, STORAGE
+from utils.image_executor import image_executor
+from utils.cache import AsyncCache
 
 
 config: Config = load_config()
@@ -95,103 +98,227 @@ def _resize_to_target_aspect(image: Image.Image, target_ratio: str) -> Image.Ima
     return cropped
 
 
-async def _image_to_url(image: PhotoSize, bot: Bot, resize: bool = False, use_min: bool = True) -> str | None:
+class ImageBudget:
+    """
+    Ограничивает суммарный объем изображений, одновременно находящихся в памяти.
+    reserve ждет, пока завершатся другие обработки и освободится место
     """
-    Загружает изображение и возвращает URL
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        # Одно изображение больше всего бюджета ждет, пока не освободится весь бюджет
+        size = min(size, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + size <= self.limit)
+            self.in_use += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= size
+                self._condition.notify_all()
+
+
+_image_budget = ImageBudget(config.images.memory_budget)
+# URL уже выгруженных изображений по (file_unique_id, вариант обработки). Ошибки выгрузки не кэшируются
+_upload_cache = AsyncCache('uploads', max_size=2048, ttl=config.images.upload_cache_ttl)
+
+
+def _estimate_image_memory(image: PhotoSize) -> int:
+    """Сжатый файл, его обработанная копия и раскодированные RGB-пиксели с учетом обрезанной копии"""
+    return (image.file_size or 0) * 2 + image.width * image.height * 3 * 2
+
+
+def _process_image(data: bytes, resize: bool = False, use_min: bool = True) -> bytes:
+    """Приводит изображение к RGB JPEG и при resize обрезает до допустимого соотношения сторон, все в памяти"""
+    with Image.open(BytesIO(data)) as img:
+        # Конвертируем в RGB если нужно
+        if img.mode in ('RGBA', 'LA', 'P'):
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            img = rgb_img
+
+        if resize:
+            # Находим допустимое соотношение сторон (ближайшее или наиболее отдаленное)
+            target_ratio = _find_closest_aspect_ratio(img.width, img.height, use_min=use_min)
+            current_ratio = img.width / img.height
+
+            logger.info(
+                f'Resizing image (use_min={use_min}): {img.width}x{img.height}, '
+                f'current ratio: {current_ratio:.3f}, target ratio: {target_ratio}')
+
+            processed_img = _resize_to_target_aspect(img, target_ratio)
+
+            logger.info(
+                f'Resized to: {processed_img.width}x{processed_img.height}, '
+                f'new ratio: {processed_img.width / processed_img.height:.3f}')
+        else:
+            # Если resize=False, используем оригинал
+            logger.info(f'Using original image: {img.width}x{img.height}, ratio: {img.width / img.height:.3f}')
+            processed_img = img
+
+        output = BytesIO()
+        processed_img.save(output, 'JPEG', quality=95, optimize=True)
+    return output.getvalue()
+
+
+class UploadError(Exception):
+    """Хранилище не приняло изображение"""
+
+
+# Варианты обработки перед отправкой: (resize, use_min) для _image_to_url
+IMAGE_VARIANTS = {
+    'original': (False, True),
+    'min-ratio': (True, True),
+    'max-ratio': (True, False),
+}
 
-    Args:
-        image: PhotoSize объект из aiogram
-        bot: Bot объект для скачивания
-        resize: Если True, изменяет изображение до допустимого формата.
-                Если False, оставляет как есть.
-        use_min: Если True - использует минимально отличающийся формат,
-                если False - использует максимально отличающийся формат
 
-    Returns:
-        URL загруженного изображения или None при ошибке
-    """
-    if not os.path.exists('download'):
-        os.mkdir('download')
+def _image_variant(resize: bool, use_min: bool) -> str:
+    if not resize:
+        return 'original'
+    return 'min-ratio' if use_min else 'max-ratio'
 
-    temp_path = f"download/temp_{image.file_unique_id}.jpg"
-    processed_path = f"download/processed_{image.file_unique_id}.jpg"
 
-    try:
+class AspectPreflight:
+    """
+    Предсказывает по размерам фото, какой вариант обработки примет модель, и учится на ответах.
+    Фото вне диапазона допустимых форматов или дальше RATIO_TOLERANCE от ближайшего сначала обрезается
+    до ближайшего формата, остальные сначала отправляются как есть. Для каждой корзины соотношения сторон
+    (шаг BUCKET_STEP) и варианта считаются принятые и отклоненные validation_error отправки: после MIN_SAMPLES
+    отправок первого варианта статистика может поменять местами оригинал и обрезку.
+    Дополнение до крайнего формата всегда остается последней попыткой
+    """
+    BUCKET_STEP = 0.05
+    # Относительное отклонение от ближайшего допустимого формата, с которым оригинал еще отправляется первым
+    RATIO_TOLERANCE = 0.05
+    MIN_SAMPLES = 20
+    # Доля принятых отправок второго варианта, пока по корзине мало данных
+    DEFAULT_RATES = {'original': 0.3, 'min-ratio': 0.8}
+
+    def __init__(self):
+        self._stats: dict[tuple[str, str], list[int]] = {}
+
+    @classmethod
+    def bucket(cls, width: int, height: int) -> str:
+        ratio = width / height if height else 1
+        return f'{round(ratio / cls.BUCKET_STEP) * cls.BUCKET_STEP:.2f}'
+
+    @classmethod
+    def crop_first(cls, width: int, height: int) -> bool:
+        """Оригинал с такими размерами скорее всего отклонят: формат вне допустимого диапазона или далек от ближайшего"""
+        ratio = width / height
+        closest = ALLOWED_ASPECT_RATIOS[_find_closest_aspect_ratio(width, height)]
+        if not min(ALLOWED_ASPECT_RATIOS.values()) <= ratio <= max(ALLOWED_ASPECT_RATIOS.values()):
+            return True
+        return abs(ratio / closest - 1) > cls.RATIO_TOLERANCE
+
+    def rate(self, width: int, height: int, variant: str) -> float | None:
+        """Доля принятых отправок варианта в корзине или None, пока отправок меньше MIN_SAMPLES"""
+        accepted, rejected = self._stats.get((self.bucket(width, height), variant), (0, 0))
+        if accepted + rejected < self.MIN_SAMPLES:
+            return None
+        return accepted / (accepted + rejected)
+
+    def order(self, width: int, height: int) -> list[str]:
+        if not height:
+            return list(IMAGE_VARIANTS)
+        if abs(width / height - ALLOWED_ASPECT_RATIOS[_find_closest_aspect_ratio(width, height)]) < 0.01:
+            # Фото уже в допустимом формате: обрезка до ближайшего формата его не изменит
+            return ['original', 'max-ratio']
+        first, second = ('min-ratio', 'original') if self.crop_first(width, height) else ('original', 'min-ratio')
+        first_rate = self.rate(width, height, first)
+        second_rate = self.rate(width, height, second)
+        if first_rate is not None and first_rate < (self.DEFAULT_RATES[second] if second_rate is None else second_rate):
+            first, second = second, first
+        return [first, second, 'max-ratio']
+
+    def record(self, width: int, height: int, variant: str, accepted: bool):
+        counts = self._stats.setdefault((self.bucket(width, height), variant), [0, 0])
+        counts[0 if accepted else 1] += 1
+
+    def snapshot(self) -> dict[str, dict[str, str]]:
+        result: dict[str, dict[str, str]] = {}
+        for (bucket, variant), (accepted, rejected) in sorted(self._stats.items()):
+            result.setdefault(bucket, {})[variant] = f'{accepted}/{accepted + rejected}'
+        return result
+
+    def log_stats(self):
+        logger.info(f'Aspect preflight accepted/total by ratio bucket: {self.snapshot()}')
+
+
+aspect_preflight = AspectPreflight()
+
+
+async def _upload_image(image: PhotoSize, bot: Bot, resize: bool, use_min: bool) -> str:
+    """Скачивает, обрабатывает и выгружает изображение в памяти, без записи на диск. При отказе хранилища бросает UploadError"""
+    async with _image_budget.reserve(_estimate_image_memory(image)):
         # Скачиваем изображение
-        await bot.download(file=image.file_id, destination=temp_path)
+        source = await bot.download(file=image.file_id, destination=BytesIO())
         logger.info('success download image')
 
-        # Открываем и проверяем изображение
-        with Image.open(temp_path) as img:
-            # Конвертируем в RGB если нужно
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
-
-            if resize:
-                # Находим допустимое соотношение сторон (ближайшее или наиболее отдаленное)
-                target_ratio = _find_closest_aspect_ratio(img.width, img.height, use_min=use_min)
-                current_ratio = img.width / img.height
-
-                logger.info(
-                    f'Resizing image (use_min={use_min}): {img.width}x{img.height}, '
-                    f'current ratio: {current_ratio:.3f}, target ratio: {target_ratio}')
-
-                processed_img = _resize_to_target_aspect(img, target_ratio)
-                processed_img.save(processed_path, 'JPEG', quality=95, optimize=True)
-
-                logger.info(
-                    f'Resized to: {processed_img.width}x{processed_img.height}, '
-                    f'new ratio: {processed_img.width / processed_img.height:.3f}')
-            else:
-                # Если resize=False, используем оригинал
-                logger.info(f'Using original image: {img.width}x{img.height}, ratio: {img.width / img.height:.3f}')
-                img.save(processed_path, 'JPEG', quality=95, optimize=True)
+        processed = await image_executor.run(_process_image, source.getvalue(), resize, use_min)
+        del source
 
         # Загружаем обработанное изображение
         url = 'https://files.storagecdn.online/upload'
 
-        with open(processed_path, 'rb') as file:
-            data = aiohttp.FormData()
-            data.add_field('file',
-                           file,
-                           filename=Path(processed_path).name,
-                           content_type='image/jpeg')
+        data = aiohttp.FormData()
+        data.add_field('file',
+                       processed,
+                       filename=f'processed_{image.file_unique_id}.jpg',
+                       content_type='image/jpeg')
 
-            headers = {
-                'Authorization': f'Bearer {config.unifically.api_token}'
-            }
+        headers = {
+            'Authorization': f'Bearer {config.unifically.api_token}'
+        }
+
+        logger.info(f'Start image to url: {image.file_unique_id} ({len(processed)} bytes)')
 
-            logger.info(f'Start image to url: {processed_path}')
+        client = get_client(STORAGE)
+        async with client.put(url, data=data, headers=headers, ssl=False) as response:
+            logger.info('success put image')
+            if response.status not in [200, 201]:
+                raise UploadError(f'error response: {await response.text()}')
+            response_data = await response.json()
+            logger.info(f'get image json data: {response_data}')
+            if response_data.get('success') != True:
+                raise UploadError(f'output: {response_data.get("message", "Unknown error")}')
 
-            async with aiohttp.ClientSession() as session:
-                async with session.put(url, data=data, headers=headers, ssl=False) as response:
-                    logger.info('success put image')
-                    if response.status not in [200, 201]:
-                        logger.error(f'Image to url error response: {await response.text()}')
-                        return None
-                    response_data = await response.json()
-                    logger.info(f'get image json data: {response_data}')
-                    if response_data.get('success') != True:
-                        logger.error(f'Image to url output: {response_data.get("message", "Unknown error")}')
-                        return None
+    return response_data['file_url']
 
-        return response_data['file_url']
 
+async def _image_to_url(image: PhotoSize, bot: Bot, resize: bool = False, use_min: bool = True) -> str | None:
+    """
+    Загружает изображение и возвращает URL.
+    URL запоминается по file_unique_id и варианту обработки, повторные попытки и генерации
+    по тому же фото не скачивают и не выгружают его заново
+
+    Args:
+        image: PhotoSize объект из aiogram
+        bot: Bot объект для скачивания
+        resize: Если True, изменяет изображение до допустимого формата.
+                Если False, оставляет как есть.
+        use_min: Если True - использует минимально отличающийся формат,
+                если False - использует максимально отличающийся формат
+
+    Returns:
+        URL загруженного изображения или None при ошибке
+    """
+    key = (image.file_unique_id, _image_variant(resize, use_min))
+    try:
+        return await _upload_cache.get(key, lambda: _upload_image(image, bot, resize, use_min))
+    except UploadError as e:
+        logger.error(f'Image to url {e}')
+        return None
     except Exception as e:
         logger.error(f'Error processing image: {e}')
         return None
 
-    finally:
-        # Удаляем временные файлы
-        for file_path in [temp_path, processed_path]:
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as e:
-                logger.debug(f'Error removing temp file {file_path}: {e}')
-
 
 async def _polling_restore_image(task_id: str) -> list[str] | dict:
     url = f'https://api.unifically.com/v1/tasks/{task_id}'
@@ -199,98 +326,87 @@ async def _polling_restore_image(task_id: str) -> list[str] | dict:
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {config.unifically.api_token}'
     }
-    async with aiohttp.ClientSession() as client:
-        while True:
-            async with client.get(url, headers=headers, ssl=False) as response:
-                if response.status not in [200, 201]:
-                    data = await response.json()
-                    return {'error': f"{data['data'].get('code')}: {data['data'].get('message')}"}
+    client = get_client(UNIFICALLY)
+    while True:
+        async with client.get(url, headers=headers, ssl=False) as response:
+            if response.status not in [200, 201]:
                 data = await response.json()
-                logger.info(f'get polling data: {data}')
-            if data['data']['status'] == 'failed':
                 return {'error': f"{data['data'].get('code')}: {data['data'].get('message')}"}
-            if data['data']['status'] == 'completed':
-                return data['data']['output']['image_url']
-            await asyncio.sleep(6)
+            data = await response.json()
+            logger.info(f'get polling data: {data}')
+        if data['data']['status'] == 'failed':
+            return {'error': f"{data['data'].get('code')}: {data['data'].get('message')}"}
+        if data['data']['status'] == 'completed':
+            return data['data']['output']['image_url']
+        await asyncio.sleep(6)
 
 
-async def restore_image(image: PhotoSize, bot: Bot, resize: bool = False, attempt: int = 0):
+async def restore_image(image: PhotoSize, bot: Bot):
     """
-    Восстанавливает изображение с попытками:
-    1. Без ресайза (если это первая попытка)
-    2. С ресайзом до ближайшего формата (минимальное отклонение)
-    3. С ресайзом до наиболее отдаленного формата (максимальное отклонение)
+    Восстанавливает изображение, перебирая варианты обработки (оригинал, ближайший формат, наиболее отдаленный формат)
+    в порядке, который предсказывает aspect_preflight по размерам фото. К следующему варианту переходит
+    только после validation_error
     """
-    logger.info(f'start restore image, attempt: {attempt}')
-
-    # Определяем параметры для текущей попытки
-    if attempt == 0:
-        # Первая попытка: оригинальное изображение
-        current_resize = False
-        use_min = True  # не используется при resize=False
-    elif attempt == 1:
-        # Вторая попытка: ресайз до ближайшего формата
-        current_resize = True
-        use_min = True
-    elif attempt == 2:
-        # Третья попытка: ресайз до наиболее отдаленного формата
-        current_resize = True
-        use_min = False
-    else:
-        # Больше попыток нет
-        return {'error': 'Max attempts exceeded (3 attempts)'}
-
-    image_url = await _image_to_url(image, bot, resize=current_resize, use_min=use_min)
-    if not image_url:
-        return {'error': 'Failed to upload image'}
+    variants = aspect_preflight.order(image.width, image.height)
+    logger.info(f'start restore image, variants: {variants}')
 
-    logger.info(f'get image url: {image_url}')
     url = 'https://api.unifically.com/v1/tasks'
-
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {config.unifically.api_token}'
     }
-    data = {
-        "model": "black-forest-labs/flux.2-pro",
-        "input": {
-            "prompt": "extremely high detail professional photo restoration and colorization, remove all scratches, dust, "
-                      "stains, noise, and damage, enhance facial features and textures, realistic skin tones, natural "
-                      "color palette, sharp focus on eyes, improve resolution and clarity, cinematic lighting, 8k, "
-                      "masterpiece, photorealistic",
-            "image_urls": [image_url],
-            "aspect_ratio": "auto",
-            "resolution": "2k"
+    client = get_client(UNIFICALLY)
+
+    for attempt, variant in enumerate(variants):
+        resize, use_min = IMAGE_VARIANTS[variant]
+        image_url = await _image_to_url(image, bot, resize=resize, use_min=use_min)
+        if not image_url:
+            return {'error': 'Failed to upload image'}
+
+        logger.info(f'get image url: {image_url}')
+        data = {
+            "model": "black-forest-labs/flux.2-pro",
+            "input": {
+                "prompt": "extremely high detail professional photo restoration and colorization, remove all scratches, dust, "
+                          "stains, noise, and damage, enhance facial features and textures, realistic skin tones, natural "
+                          "color palette, sharp focus on eyes, improve resolution and clarity, cinematic lighting, 8k, "
+                          "masterpiece, photorealistic",
+                "image_urls": [image_url],
+                "aspect_ratio": "auto",
+                "resolution": "2k"
+            }
         }
-    }
 
-    async with aiohttp.ClientSession() as client:
         async with client.post(url, headers=headers, json=data, ssl=False) as response:
             logger.info(f'response status: {response.status}')
             if response.status not in [200, 201]:
                 error_data = await response.json()
                 code = error_data['data'].get('code')
                 message = error_data['data'].get('message')
-                print(f"Attempt {attempt + 1} failed: {code}, {message}")
+                print(f"Attempt {attempt + 1} ({variant}) failed: {code}, {message}")
 
-                # Если это validation_error и есть еще попытки
-                if code == 'validation_error' and attempt < 2:
-                    logger.info(f'Retrying with different aspect ratio, attempt: {attempt + 1}')
-                    return await restore_image(image, bot, True, attempt + 1)
+                if code == 'validation_error':
+                    aspect_preflight.record(image.width, image.height, variant, accepted=False)
+                    # Если есть еще варианты
+                    if attempt < len(variants) - 1:
+                        logger.info(f'Retrying with different aspect ratio, attempt: {attempt + 1}')
+                        continue
 
                 return {'error': f"{code}: {message}"}
 
+            aspect_preflight.record(image.width, image.height, variant, accepted=True)
             data = await response.json()
             logger.info(f'post output data: {data}')
+        break
 
-        if data['code'] != 200:
-            return {'error': f"{data['data'].get('code')}: {data['data'].get('message')}"}
+    if data['code'] != 200:
+        return {'error': f"{data['data'].get('code')}: {data['data'].get('message')}"}
 
-        if data['data'].get('output'):
-            return data['data']['output']['image_url']
+    if data['data'].get('output'):
+        return data['data']['output']['image_url']
 
-        task_id = data['data'].get('task_id')
-        logger.info('success post image')
+    task_id = data['data'].get('task_id')
+    logger.info('success post image')
 
     return await _polling_restore_image(task_id)
 
@@ -302,18 +418,18 @@ async def _polling_revive_image(task_id: str):
     }
     url = f'https://api.unifically.com/v1/tasks/{task_id}'
 
-    async with aiohttp.ClientSession() as client:
-        while True:
-            async with client.get(url, headers=headers) as response:
-                if response.status != 200:
-                    return {'error': await response.text()}
-                data = await response.json()
-                print(data)
-                if data['data']['status'] == 'failed':
-                    return {"error": f"{data['data']['error']['code']}: {data['data']['error']['message']}"}
-                if data['data']['status'] == 'completed':
-                    return data['data']['output']['video_url']
-                await asyncio.sleep(14)
+    client = get_client(UNIFICALLY)
+    while True:
+        async with client.get(url, headers=headers) as response:
+            if response.status != 200:
+                return {'error': await response.text()}
+            data = await response.json()
+            print(data)
+            if data['data']['status'] == 'failed':
+                return {"error": f"{data['data']['error']['code']}: {data['data']['error']['message']}"}
+            if data['data']['status'] == 'completed':
+                return data['data']['output']['video_url']
+            await asyncio.sleep(14)
 
 
 async def revive_image(prompt: str, image: PhotoSize, bot: Bot, motion_id: str = 'd2389a9a-91c2-4276-bc9c-c9e35e8fb85a'):
@@ -334,15 +450,15 @@ async def revive_image(prompt: str, image: PhotoSize, bot: Bot, motion_id: str =
             #"start_image_url": image,
         }
     }
-    async with aiohttp.ClientSession() as client:
-        async with client.post(url, headers=headers, json=data) as response:
-            if response.status != 200:
-                return {'error': await response.text()}
-            data = await response.json()
-            if data['code'] != 200:
-                error = f"{data['code']}: {data['data']['error']['message']}"
-                return {'error': error}
-            task_id = data['data']['task_id']
+    client = get_client(UNIFICALLY)
+    async with client.post(url, headers=headers, json=data) as response:
+        if response.status != 200:
+            return {'error': await response.text()}
+        data = await response.json()
+        if data['code'] != 200:
+            error = f"{data['code']}: {data['data']['error']['message']}"
+            return {'error': error}
+        task_id = data['data']['task_id']
     return await _polling_revive_image(task_id)
 
 
@@ -367,15 +483,15 @@ async def test_func(motion_id: str = 'd2389a9a-91c2-4276-bc9c-c9e35e8fb85a'):
             #"start_image_url": image,
         }
     }
-    async with aiohttp.ClientSession() as client:
-        async with client.post(url, headers=headers, json=data) as response:
-            if response.status != 200:
-                return {'error': await response.text()}
-            data = await response.json()
-            if data['code'] != 200:
-                error = f"{data['code']}: {data['data']['error']['message']}"
-                return {'error': error}
-            task_id = data['data']['task_id']
+    client = get_client(UNIFICALLY)
+    async with client.post(url, headers=headers, json=data) as response:
+        if response.status != 200:
+            return {'error': await response.text()}
+        data = await response.json()
+        if data['code'] != 200:
+            error = f"{data['code']}: {data['data']['error']['message']}"
+            return {'error': error}
+        task_id = data['data']['task_id']
     return await _polling_revive_image(task_id)
 
 
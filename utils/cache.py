@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+logger = logging.getLogger(__name__)
+
+_caches: list['AsyncCache'] = []
+# Результат загрузки, отмененной вместе с вызвавшим ее запросом
+_RETRY = object()
+
+
+class AsyncCache:
+    """
+    Кэш с чтением через загрузчик: TTL на запись, вытеснение давно не использованных ключей при max_size
+    и один общий запрос на все одновременные промахи по ключу.
+    Запись, загруженная до invalidate, в кэш уже не попадет
+    """
+    def __init__(self, name: str, max_size: int = 1024, ttl: float | None = 60):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        _caches.append(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable) -> tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: float | None = None) -> Any:
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        while (future := self._inflight.get(key)) is not None:
+            value = await asyncio.shield(future)
+            if value is not _RETRY:
+                return value
+            # Загружавший запрос отменен: ключ загружает кто-то из ожидавших
+            found, value = self._lookup(key)
+            if found:
+                return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except BaseException as err:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if isinstance(err, asyncio.CancelledError):
+                # Отмена касается только загружавшего, ожидающие повторят загрузку сами
+                future.set_result(_RETRY)
+            else:
+                future.set_exception(err)
+                # Ошибка уже пробрасывается вызывающему, ожидающих может и не быть
+                future.exception()
+            raise
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            self.set(key, value, ttl)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, *keys: Hashable):
+        for key in keys:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+def log_caches_stats():
+    for cache in _caches:
+        logger.info(f'Cache {cache.name}: {cache.stats()}')
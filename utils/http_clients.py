@@ -0,0 +1,54 @@
+import logging
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from config_data.config import Config, load_config
+
+
+config: Config = load_config()
+
+logger = logging.getLogger(__name__)
+
+# Внешние сервисы, для каждого держится своя сессия со своим пулом соединений
+UNIFICALLY = 'unifically'
+STORAGE = 'storage'
+
+_clients: dict[str, ClientSession] = {}
+
+
+def _create_client() -> ClientSession:
+    connector = TCPConnector(
+        limit_per_host=config.http.limit_per_host,
+        ttl_dns_cache=config.http.dns_ttl,
+        keepalive_timeout=config.http.keepalive_timeout
+    )
+    timeout = ClientTimeout(
+        total=config.http.total_timeout,
+        sock_connect=config.http.connect_timeout,
+        sock_read=config.http.read_timeout
+    )
+    return ClientSession(connector=connector, timeout=timeout)
+
+
+def get_client(name: str) -> ClientSession:
+    """
+    Долгоживущая сессия для сервиса name: соединения переиспользуются между запросами,
+    DNS кэшируется. Создается при первом обращении, если не была создана при старте
+    """
+    client = _clients.get(name)
+    if client is None or client.closed:
+        client = _clients[name] = _create_client()
+    return client
+
+
+async def start_clients():
+    for name in (UNIFICALLY, STORAGE):
+        get_client(name)
+
+
+async def close_clients():
+    for name, client in list(_clients.items()):
+        if not client.closed:
+            await client.close()
+        logger.info(f'HTTP client {name} closed')
+    _clients.clear()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from bisect import bisect_left
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable
+
+from config_data.config import Config, load_config
+
+
+config: Config = load_config()
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(func: Callable, *args) -> tuple[Any, float]:
+    """Выполняется в пуле: возвращает результат и чистое время обработки"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class ImageExecutor:
+    """
+    Выполняет обработку изображений в пуле потоков или процессов, не блокируя event loop.
+    В пул одновременно передается не больше workers + queue_size задач, остальные ждут своей очереди в event loop
+    """
+    # Верхние границы корзин гистограммы времени обработки, в секундах
+    TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, kind: str = 'thread', workers: int = 2, queue_size: int = 16):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'Unknown executor kind: {kind}')
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Executor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self.waiting = 0
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.time_sum = 0.0
+        self.time_max = 0.0
+        self.time_histogram = [0] * (len(self.TIME_BUCKETS) + 1)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                # spawn, чтобы дочерние процессы не наследовали event loop и соединения бота
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='image')
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Задачи, которые еще не начали выполняться: ждущие места в пуле и стоящие в очереди пула"""
+        return self.waiting + max(self.submitted - self.workers, 0)
+
+    def observe(self, seconds: float):
+        self.processed += 1
+        self.time_sum += seconds
+        self.time_max = max(self.time_max, seconds)
+        self.time_histogram[bisect_left(self.TIME_BUCKETS, seconds)] += 1
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Выполняет func(*args) в пуле. Для пула процессов func и аргументы должны сериализоваться pickle"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.submitted += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, seconds = await loop.run_in_executor(self._get_executor(), _timed, func, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.submitted -= 1
+            self._slots.release()
+        self.observe(seconds)
+        return result
+
+    def snapshot(self) -> dict:
+        labels = [f'<={bucket}s' for bucket in self.TIME_BUCKETS] + [f'>{self.TIME_BUCKETS[-1]}s']
+        return {
+            'kind': self.kind,
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'in_pool': self.submitted,
+            'processed': self.processed,
+            'failed': self.failed,
+            'time_avg': self.time_sum / self.processed if self.processed else 0.0,
+            'time_max': self.time_max,
+            'time_histogram': dict(zip(labels, self.time_histogram)),
+        }
+
+    def log_stats(self):
+        logger.info(f'Image executor stats: {self.snapshot()}')
+
+    async def shutdown(self):
+        """Отменяет не начатые задачи и ждет текущие в отдельном потоке, не блокируя event loop"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+image_executor = ImageExecutor(
+    kind=config.images.executor,
+    workers=config.images.workers,
+    queue_size=config.images.queue_size
+)
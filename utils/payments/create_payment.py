@@ -6,6 +6,7 @@ from yookassa import Payment, Configuration, Payout
 from yookassa.payment import PaymentResponse
 
 from config_data.config import Config, load_config
+from utils.cache import AsyncCache
 
 
 config: Config = load_config()
@@ -13,8 +14,11 @@ config: Config = load_config()
 Configuration.account_id = config.yookassa.account_id
 Configuration.secret_key = config.yookassa.secret_key
 
+# Курс обновляется у источника раз в сутки, поэтому держим его в памяти несколько минут
+_fx_cache = AsyncCache('fx', max_size=8, ttl=600)
 
-async def _get_usdt_rub() -> float:
+
+async def _fetch_usdt_rub() -> float:
     url = 'https://open.er-api.com/v6/latest/USD'
     async with ClientSession() as session:
         async with session.get(url, ssl=False) as res:
@@ -23,6 +27,10 @@ async def _get_usdt_rub() -> float:
     return float(rub)
 
 
+async def _get_usdt_rub() -> float:
+    return await _fx_cache.get('USD/RUB', _fetch_usdt_rub)
+
+
 async def get_yookassa_url(amount: int, description: str):
     payment = await Payment.create({
         "amount": {
@@ -58,22 +58,20 @@ async def _poll_payment(payment_id, user_id: int, amount: int, cost: int, rate_t
                 chat_id=user_id,
                 text='✅Оплата прошла успешно'
             )
-            await execute_rate(user_id, bot, amount, cost, rate_type, session)
+            await execute_rate(user_id, bot, amount, cost, rate_type, session, payment_type)
             break
         await asyncio.sleep(interval)
 
 
 async def execute_rate(user_id: int, bot: Bot, amount: int,
-                       cost: int, rate_type: str, session: DataInteraction):
-    user = await session.get_user(user_id)
-    await session.add_income(cost)
-    if user.join:
-        await session.update_deeplink_earn(user.join, cost)
-    if user.referral:
-        await session.increment_user_value(user.referral, 'revives', 1)
-        await session.increment_user_value(user.referral, 'revives_earn', 1)
+                       cost: int, rate_type: str, session: DataInteraction, provider: str):
+    async with session.transaction() as transaction:
+        user = await transaction.get_user(user_id, for_update=True)
+        await transaction.add_payment(user_id, cost, rate_type, amount, provider, user.join)
+        if user.referral:
+            await transaction.increment_user_values(user.referral, revives=1, revives_earn=1)
+        await transaction.increment_user_values(user_id, **{'revives' if rate_type == 'revive' else 'restores': amount})
 
-    await session.increment_user_value(user_id, 'revives' if rate_type == 'revive' else 'restores', amount)
     try:
         await bot.send_message(
             chat_id=user_id,
@@ -9,13 +9,12 @@ from database.action_data_class import DataInteraction
 
 
 async def send_messages(bot: Bot, session: DataInteraction, keyboard: InlineKeyboardMarkup|None, message: Message, **kwargs):
-    users = await session.get_users()
     text = kwargs.get('text')
     caption = kwargs.get('caption')
     photo = kwargs.get('photo')
     video = kwargs.get('video')
     if text:
-        for user in users:
+        async for user in session.iter_users('user_id', 'name', 'active'):
             try:
                 await bot.send_message(
                     chat_id=user.user_id,
@@ -29,7 +28,7 @@ async def send_messages(bot: Bot, session: DataInteraction, keyboard: InlineKeyb
                 await session.set_active(user.user_id, 0)
     elif caption:
         if photo:
-            for user in users:
+            async for user in session.iter_users('user_id', 'name', 'active'):
                 try:
                     await bot.send_photo(
                         chat_id=user.user_id,
@@ -43,7 +42,7 @@ async def send_messages(bot: Bot, session: DataInteraction, keyboard: InlineKeyb
                     print(err)
                     await session.set_active(user.user_id, 0)
         else:
-            for user in users:
+            async for user in session.iter_users('user_id', 'name', 'active'):
                 try:
                     await bot.send_video(
                         chat_id=user.user_id,
@@ -1,51 +1,30 @@
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from database.action_data_class import DataInteraction
+from database.buffers import ActivityBuffer, CounterBuffer
 
 
-async def wrapper_today(session: DataInteraction):
-    for link in await session.get_deeplinks():
-        await session.set_deeplink_value(deeplink_id=link.id, today=0)
-    await session.set_static_value(today=0)
-
-
-async def wrapper_week(session: DataInteraction):
-    for link in await session.get_deeplinks():
-        await session.set_deeplink_value(deeplink_id=link.id, week=0)
-    await session.set_static_value(week=0)
-
-
-async def wrapper_month(session: DataInteraction):
-    await session.set_static_value(month=0)
-
-
-async def start_schedulers(scheduler: AsyncIOScheduler, session: DataInteraction):
+async def start_schedulers(scheduler: AsyncIOScheduler, session: DataInteraction, activity: ActivityBuffer,
+                           counters: CounterBuffer):
     """Запуск всех планировщиков"""
-    # Ежедневный сброс в 00:00
+    # Сброс накопленной активности пользователей
     scheduler.add_job(
-        wrapper_today,
-        'cron',
-        args=[session],
-        hour=0,
-        minute=0,
-        id='reset_daily_profit'
+        activity.flush,
+        'interval',
+        seconds=10,
+        id='flush_activity'
     )
+    # Запись накопленных переходов по диплинкам и рефералов
     scheduler.add_job(
-        wrapper_week,
-        'cron',
-        args=[session],
-        day_of_week='mon',
-        hour=0,
-        minute=0,
-        id='reset_weekly_profit'
+        counters.flush,
+        'interval',
+        seconds=5,
+        id='flush_counters'
     )
+    # Свертка журнала платежей в дневные агрегаты дохода
     scheduler.add_job(
-        wrapper_month,
-        'cron',
-        args=[session],
-        day=1,
-        hour=0,
-        minute=0,
-        id='reset_monthly_profit'
+        session.update_rollups,
+        'interval',
+        minutes=1,
+        id='update_rollups'
     )
-